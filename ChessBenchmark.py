@@ -0,0 +1,257 @@
+'''
+Benchmarks on fixed inputs: the book games of the notebooks in BOOK_FOLDER, the
+game of ChessGraphTest.ipynb and synthetic long games of random legal moves drawn
+from a fixed seed. The book has seven games but only six notebooks are bundled
+(Game1 to Game4, Game6 and Game7, there is no Game5), so six book games are
+benchmarked; the games of a run are listed in its results. It measures
+
+    makeMove      plies per second replaying the games
+    graph         ChessGraph constructions per second (white, black and both sides)
+    space         getSpace calls per second
+    averageDegree ChessGraph.getAverageDegree calls per second
+
+and the peak memory (tracemalloc) of a replay with graphs, and compares them with
+a baseline JSON file written by an earlier run. Every repetition starts with an
+empty transposition cache, the best repetition is kept.
+'''
+import ast
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import re
+import sys
+import time
+import tracemalloc
+from ChessGame import ChessBoard, PieceColor
+from ChessGraph import ChessGraph
+from ChessHashing import TranspositionCache
+from ChessPerft import getLegalMoves
+
+BOOK_FOLDER = "Book_Games_Understanding Chess Move by Move"
+GRAPH_TEST_NOTEBOOK = "ChessGraphTest.ipynb"
+MAKE_MOVE_PATTERN = re.compile(r'makeMove\(\s*"([^"]+)"\s*\)')
+#Rates (per second) and memory compared with the baseline
+BENCHMARKS = ["makeMove", "graph", "space", "averageDegree"]
+
+
+def readNotebookGame(path):
+    '''
+    Moves of the game played in a notebook: its gameMoves list if it has one,
+    otherwise the makeMove calls of its code cells in order
+    '''
+    with open(path, "r", encoding = "utf-8") as notebookFile:
+        notebook = json.load(notebookFile)
+    sources = ["".join(cell["source"]) for cell in notebook["cells"] if cell["cell_type"] == "code"]
+    for source in sources:
+        try:
+            tree = ast.parse(source)
+        except SyntaxError:
+            continue
+        for node in ast.walk(tree):
+            if(isinstance(node, ast.Assign) and any(isinstance(target, ast.Name) and target.id == "gameMoves" for target in node.targets)):
+                return ast.literal_eval(node.value)
+
+    moves = []
+    for source in sources:
+        moves.extend(MAKE_MOVE_PATTERN.findall(source))
+    return moves
+
+
+def getSyntheticGame(nPlies, seed):
+    '''
+    Up to nPlies random legal moves from the initial position, the same for a
+    given seed (moves are drawn from the sorted UCI list of each position)
+    '''
+    generator = random.Random(seed)
+    board = ChessBoard(transpositionCache = None)
+    board.initializeBoard()
+    for ply in range(0,nPlies):
+        if(board.gameEnded):
+            break
+        legalMoves = sorted(getLegalMoves(board), key = lambda legalMove: legalMove[0])
+        if(len(legalMoves) == 0):
+            break
+        uciMove = legalMoves[generator.randrange(len(legalMoves))][0]
+        board.pushMoveUCI(uciMove)
+    return board.getSANMoves()
+
+
+def getBenchmarkGames(nSyntheticGames = 2, syntheticPlies = 300, seed = 2024):
+    '''
+    Dict of the benchmark games by name, as lists of move strings (the six bundled
+    book games, see the module, the ChessGraphTest game and the synthetic ones)
+    '''
+    games = {}
+    bookGames = sorted(name for name in os.listdir(BOOK_FOLDER) if name.endswith(".ipynb"))
+    for name in bookGames:
+        games["book_" + name[:-len(".ipynb")]] = readNotebookGame(os.path.join(BOOK_FOLDER, name))
+    games["graphTest"] = readNotebookGame(GRAPH_TEST_NOTEBOOK)
+    for i in range(0,nSyntheticGames):
+        games["synthetic_" + str(i)] = getSyntheticGame(syntheticPlies, seed + i)
+    return games
+
+
+def replayGames(games, boardOptions, onPly = None):
+    '''
+    Plays the games with makeMove on new boards sharing a new transposition cache,
+    calling onPly(board) after the initial position and every move. Returns the
+    number of plies played and the seconds spent in makeMove.
+    '''
+    options = dict(boardOptions)
+    options.setdefault("transpositionCache", TranspositionCache())
+    nPlies = 0
+    seconds = 0.0
+    for name in games:
+        board = ChessBoard(**options)
+        board.initializeBoard()
+        if(not onPly is None):
+            onPly(board)
+        for moveString in games[name]:
+            #makeMove prints the end of the game
+            with contextlib.redirect_stdout(io.StringIO()):
+                startTime = time.perf_counter()
+                result = board.makeMove(moveString)
+                seconds = seconds + time.perf_counter() - startTime
+            if(result == -1):
+                print("Invalid move " + moveString + " in " + name)
+                break
+            nPlies = nPlies + 1
+            if(not onPly is None):
+                onPly(board)
+    return nPlies, seconds
+
+
+def measurePositions(games, boardOptions):
+    '''
+    Counts and seconds of the graph, space and averageDegree benchmarks over every
+    position of the games
+    '''
+    counts = {"graph": 0, "space": 0, "averageDegree": 0}
+    seconds = {"graph": 0.0, "space": 0.0, "averageDegree": 0.0}
+
+    def onPly(board):
+        startTime = time.perf_counter()
+        graphs = [ChessGraph(board, True, PieceColor.WHITE), ChessGraph(board, True, PieceColor.BLACK), ChessGraph(board, False, -1)]
+        seconds["graph"] = seconds["graph"] + time.perf_counter() - startTime
+        counts["graph"] = counts["graph"] + len(graphs)
+
+        startTime = time.perf_counter()
+        board.getSpace(PieceColor.WHITE)
+        board.getSpace(PieceColor.BLACK)
+        seconds["space"] = seconds["space"] + time.perf_counter() - startTime
+        counts["space"] = counts["space"] + 2
+
+        startTime = time.perf_counter()
+        for graph in graphs:
+            graph.getAverageDegree()
+        seconds["averageDegree"] = seconds["averageDegree"] + time.perf_counter() - startTime
+        counts["averageDegree"] = counts["averageDegree"] + len(graphs)
+
+    replayGames(games, boardOptions, onPly)
+    return counts, seconds
+
+
+def measurePeakMemory(games, boardOptions):
+    '''
+    Peak memory in MB allocated while replaying the games with their graphs
+    '''
+    tracemalloc.start()
+    try:
+        measurePositions(games, boardOptions)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak/2**20
+
+
+def runBenchmarks(games = None, repetitions = 3, **boardOptions):
+    '''
+    Runs every benchmark repetitions times on boards built with boardOptions and
+    returns the results dict (best rate of the repetitions per benchmark)
+    '''
+    if(games is None):
+        games = getBenchmarkGames()
+
+    benchmarks = {}
+    def keepBest(name, count, seconds):
+        rate = count/max(seconds, 1e-9)
+        if(not name in benchmarks or rate > benchmarks[name]["perSecond"]):
+            benchmarks[name] = {"count": count, "seconds": seconds, "perSecond": rate}
+
+    for repetition in range(0,repetitions):
+        nPlies, seconds = replayGames(games, boardOptions)
+        keepBest("makeMove", nPlies, seconds)
+        counts, seconds = measurePositions(games, boardOptions)
+        for name in counts:
+            keepBest(name, counts[name], seconds[name])
+
+    return {"benchmarks": benchmarks, "peakMemoryMB": measurePeakMemory(games, boardOptions),
+            "games": {name: len(games[name]) for name in games},
+            "boardOptions": {name: str(boardOptions[name]) for name in boardOptions},
+            "python": platform.python_version(), "machine": platform.machine()}
+
+
+def saveResults(results, path):
+    with open(path, "w") as resultsFile:
+        json.dump(results, resultsFile, indent = 1)
+
+
+def compareWithBaseline(results, baseline, tolerance = 0.2):
+    '''
+    Prints every benchmark next to its baseline (a results dict or the path of a
+    saved one) and returns the names of those slower, or using more memory, than
+    the baseline by more than tolerance (a fraction)
+    '''
+    if(isinstance(baseline, str)):
+        with open(baseline, "r") as baselineFile:
+            baseline = json.load(baselineFile)
+
+    regressions = []
+    for name in BENCHMARKS:
+        rate = results["benchmarks"][name]["perSecond"]
+        baselineRate = baseline["benchmarks"].get(name, {}).get("perSecond")
+        if(baselineRate is None):
+            print("%-14s %12.1f /s   (no baseline)" % (name, rate))
+            continue
+        slower = rate < baselineRate*(1 - tolerance)
+        if(slower):
+            regressions.append(name)
+        print("%-14s %12.1f /s   baseline %12.1f /s   %+6.1f%% %s" % (name, rate, baselineRate, 100*(rate/baselineRate - 1), "SLOWER" if slower else ""))
+
+    memory = results["peakMemoryMB"]
+    baselineMemory = baseline.get("peakMemoryMB")
+    if(not baselineMemory is None):
+        larger = memory > baselineMemory*(1 + tolerance)
+        if(larger):
+            regressions.append("peakMemoryMB")
+        print("%-14s %12.1f MB   baseline %12.1f MB   %+6.1f%% %s" % ("peakMemory", memory, baselineMemory, 100*(memory/baselineMemory - 1), "LARGER" if larger else ""))
+    if(results["games"] != baseline.get("games")):
+        print("The games differ from the ones of the baseline")
+    if(results["boardOptions"] != baseline.get("boardOptions")):
+        print("The board options differ from the ones of the baseline")
+    return regressions
+
+
+if __name__ == "__main__":
+    #python ChessBenchmark.py [baseline.json] [visionBackend] [moveUpdateMode]
+    #Compares with the baseline file when it exists, otherwise writes it
+    baselinePath = sys.argv[1] if len(sys.argv) > 1 else "benchmark_baseline.json"
+    boardOptions = {}
+    if(len(sys.argv) > 2):
+        boardOptions["visionBackend"] = sys.argv[2]
+    if(len(sys.argv) > 3):
+        boardOptions["moveUpdateMode"] = sys.argv[3]
+
+    results = runBenchmarks(**boardOptions)
+    if(not os.path.exists(baselinePath)):
+        saveResults(results, baselinePath)
+        for name in BENCHMARKS:
+            print("%-14s %12.1f /s" % (name, results["benchmarks"][name]["perSecond"]))
+        print("%-14s %12.1f MB" % ("peakMemory", results["peakMemoryMB"]))
+        print("Baseline written to " + baselinePath)
+        sys.exit(0)
+    regressions = compareWithBaseline(results, baselinePath)
+    sys.exit(1 if len(regressions) > 0 else 0)
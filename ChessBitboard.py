@@ -0,0 +1,152 @@
+'''
+Bitboard tables for move generation. Squares follow the SQUARE_INDEX convention
+of ChessGame (a1 = 0, b1 = 1, ..., h8 = 63), so bit i of a bitboard is square i.
+
+Colors are indexed with PieceColor.value (0 white, 1 black).
+'''
+
+FULL_BOARD = (1 << 64) - 1
+
+#(file step, rank step) of each ray, the first four go up in square index
+NORTH = 0
+EAST = 1
+NORTH_EAST = 2
+NORTH_WEST = 3
+SOUTH = 4
+WEST = 5
+SOUTH_WEST = 6
+SOUTH_EAST = 7
+DIRECTION_STEPS = [(0,1), (1,0), (1,1), (-1,1), (0,-1), (-1,0), (-1,-1), (1,-1)]
+ROOK_DIRECTIONS = [NORTH, EAST, SOUTH, WEST]
+BISHOP_DIRECTIONS = [NORTH_EAST, NORTH_WEST, SOUTH_WEST, SOUTH_EAST]
+
+def isOnBoard(fileIndex, rankIndex):
+    return fileIndex >= 0 and fileIndex <= 7 and rankIndex >= 0 and rankIndex <= 7
+
+def computeLeaperTable(steps):
+    table = []
+    for squareIndex in range(0,64):
+        fileIndex = squareIndex % 8
+        rankIndex = squareIndex // 8
+        bitboard = 0
+        for fileStep, rankStep in steps:
+            if(isOnBoard(fileIndex + fileStep, rankIndex + rankStep)):
+                bitboard = bitboard | (1 << (fileIndex + fileStep + 8*(rankIndex + rankStep)))
+        table.append(bitboard)
+    return table
+
+def computeRayTable():
+    table = []
+    for fileStep, rankStep in DIRECTION_STEPS:
+        rays = []
+        for squareIndex in range(0,64):
+            fileIndex = squareIndex % 8 + fileStep
+            rankIndex = squareIndex // 8 + rankStep
+            bitboard = 0
+            while(isOnBoard(fileIndex, rankIndex)):
+                bitboard = bitboard | (1 << (fileIndex + 8*rankIndex))
+                fileIndex = fileIndex + fileStep
+                rankIndex = rankIndex + rankStep
+            rays.append(bitboard)
+        table.append(rays)
+    return table
+
+KNIGHT_ATTACKS = computeLeaperTable([(1,2), (2,1), (2,-1), (1,-2), (-1,-2), (-2,-1), (-2,1), (-1,2)])
+KING_ATTACKS = computeLeaperTable([(0,1), (1,1), (1,0), (1,-1), (0,-1), (-1,-1), (-1,0), (-1,1)])
+PAWN_ATTACKS = [computeLeaperTable([(-1,1), (1,1)]), computeLeaperTable([(-1,-1), (1,-1)])]
+PAWN_PUSHES = [computeLeaperTable([(0,1)]), computeLeaperTable([(0,-1)])]
+RAYS = computeRayTable()
+
+RANK_MASKS = [0xFF << (8*i) for i in range(0,8)]
+
+def computeDirectionTable():
+    '''
+    DIRECTION_TABLE[a][b] is the ray direction going from square a to square b, or
+    -1 when they do not share a rank, file or diagonal
+    '''
+    table = [[-1]*64 for i in range(0,64)]
+    for direction in range(0,8):
+        for fromSquare in range(0,64):
+            for toSquare in getSquareIndices(RAYS[direction][fromSquare]):
+                table[fromSquare][toSquare] = direction
+    return table
+
+def computeBetweenTable():
+    table = [[0]*64 for i in range(0,64)]
+    for fromSquare in range(0,64):
+        for toSquare in range(0,64):
+            direction = DIRECTION_TABLE[fromSquare][toSquare]
+            if(direction >= 0):
+                table[fromSquare][toSquare] = RAYS[direction][fromSquare] & ~RAYS[direction][toSquare] & ~(1 << toSquare)
+    return table
+
+def getLowestSquare(bitboard):
+    return (bitboard & -bitboard).bit_length() - 1
+
+def getHighestSquare(bitboard):
+    return bitboard.bit_length() - 1
+
+def getSquareIndices(bitboard):
+    indices = []
+    while(bitboard):
+        lowestBit = bitboard & -bitboard
+        indices.append(lowestBit.bit_length() - 1)
+        bitboard = bitboard ^ lowestBit
+    return indices
+
+def countSquares(bitboard):
+    return bin(bitboard).count("1")
+
+def getRayAttacks(direction, squareIndex, occupancy):
+    '''
+    Classical ray lookup: the ray stops at (and includes) the first occupied square
+    '''
+    ray = RAYS[direction][squareIndex]
+    blockers = ray & occupancy
+    if(blockers):
+        if(direction < SOUTH):
+            ray = ray ^ RAYS[direction][getLowestSquare(blockers)]
+        else:
+            ray = ray ^ RAYS[direction][getHighestSquare(blockers)]
+    return ray
+
+def getBishopAttacks(squareIndex, occupancy):
+    return (getRayAttacks(NORTH_EAST, squareIndex, occupancy) | getRayAttacks(NORTH_WEST, squareIndex, occupancy)
+            | getRayAttacks(SOUTH_WEST, squareIndex, occupancy) | getRayAttacks(SOUTH_EAST, squareIndex, occupancy))
+
+def getRookAttacks(squareIndex, occupancy):
+    return (getRayAttacks(NORTH, squareIndex, occupancy) | getRayAttacks(EAST, squareIndex, occupancy)
+            | getRayAttacks(SOUTH, squareIndex, occupancy) | getRayAttacks(WEST, squareIndex, occupancy))
+
+def getQueenAttacks(squareIndex, occupancy):
+    return getBishopAttacks(squareIndex, occupancy) | getRookAttacks(squareIndex, occupancy)
+
+def getPieceAttacks(pieceLetter, colorIndex, squareIndex, occupancy):
+    '''
+    Squares attacked by a piece, pieceLetter is the PieceType value ("" for pawns)
+    '''
+    if(pieceLetter == ""):
+        return PAWN_ATTACKS[colorIndex][squareIndex]
+    elif(pieceLetter == "N"):
+        return KNIGHT_ATTACKS[squareIndex]
+    elif(pieceLetter == "B"):
+        return getBishopAttacks(squareIndex, occupancy)
+    elif(pieceLetter == "R"):
+        return getRookAttacks(squareIndex, occupancy)
+    elif(pieceLetter == "Q"):
+        return getQueenAttacks(squareIndex, occupancy)
+    else:
+        return KING_ATTACKS[squareIndex]
+
+def getPawnPushes(colorIndex, squareIndex, occupancy, firstMove):
+    '''
+    Forward pawn moves, the double step needs both squares in front to be free
+    '''
+    pushes = PAWN_PUSHES[colorIndex][squareIndex] & ~occupancy
+    if(firstMove and pushes):
+        pushes = pushes | (PAWN_PUSHES[colorIndex][getLowestSquare(pushes)] & ~occupancy)
+    return pushes
+
+DIRECTION_TABLE = computeDirectionTable()
+#Squares strictly between two aligned squares
+BETWEEN = computeBetweenTable()
@@ -0,0 +1,242 @@
+'''
+Consistency checks of the move generation and notation code, on the bundled games
+of ChessBenchmark and the positions of ChessPerft. Every check returns a list of
+failure messages, empty when it passes.
+
+    python ChessChecks.py
+
+runs them all for both vision backends and exits with 1 if any fails, as
+ChessPerft.py does for the node counts.
+'''
+import sys
+import io
+import contextlib
+import random
+import numpy as np
+from ChessGame import ChessBoard, PieceColor
+from ChessGraph import ChessGraph
+from ChessPerft import PERFT_POSITIONS, perft, getLegalMoves
+from ChessBenchmark import getBenchmarkGames
+
+VISION_BACKENDS = ["bitboard", "mailbox"]
+#FEN strings loadFEN has to refuse
+INVALID_FENS = ["rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq -  0",
+                "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP w KQkq - 0 1",
+                "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1",
+                "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQxq - 0 1",
+                "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq e9 0 1",
+                "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - a 1",
+                "rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                "rnbqkbnr/pppppppp/7/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                "rnbqkbnr/ppppxppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                "rnbq1bnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQ - 0 1",
+                "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBKKBNR w kq - 0 1",
+                "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e4 0 1",
+                "rnbqkbnr/pppppppp/8/8/8/4P3/PPPP1PPP/RNBQKBNR b KQkq e3 0 1",
+                "4k3/8/8/8/8/8/8/R3K1NB w KQ - 0 1",
+                "b3k3/8/8/8/8/8/8/4K3 b q - 0 1",
+                "4k3/8/8/8/8/8/8/R4K1R w KQ - 0 1"]
+#FEN strings with castling pieces next to other pieces on their squares, loaded
+#without castling moves for the rights they do not have
+CASTLING_FENS = ["4k3/8/8/8/8/8/8/R3K1NB w Q - 0 1",
+                 "b3k2r/8/8/8/8/8/8/4K3 b k - 0 1",
+                 "r3k2b/8/8/8/8/8/8/4K3 b q - 0 1"]
+#Positions where three or more pieces of a type reach one square
+DISAMBIGUATION_FENS = ["3R4/nq2k3/2b3P1/pN5N/6R1/1P2P3/3R4/2B1KB2 w - - 5 49",
+                       "4k3/8/8/1N3N2/8/1N3N2/8/4K3 w - - 0 1",
+                       "3rk3/8/8/8/r6r/8/8/3rK3 b - - 0 1",
+                       "4k3/8/8/8/Q2Q4/8/8/Q3K3 w - - 0 1"]
+#Positions with pawns about to promote, for the random replays of checkIncrementalUpdates
+PROMOTION_FENS = ["8/PPPk4/8/8/8/8/4Kppp/8 w - - 0 1",
+                  "1n2k3/P1PP4/8/8/8/8/2pp1p1p/R3K1N1 b Q - 0 1"]
+
+
+def checkIncrementalUpdates(games, perftDepth = 2, nRandomPlies = 40, seed = 2024, **boardOptions):
+    '''
+    Replays the games, runs perft on the perft positions and plays nRandomPlies
+    random moves (drawn from seed) from the DISAMBIGUATION_FENS and PROMOTION_FENS
+    positions with moveUpdateMode "verify", which computes the move lists
+    incrementally and in full after every move. Fails on any difference recorded in
+    incrementalMismatches.
+    '''
+    failures = []
+    for name in games:
+        board = ChessBoard(moveUpdateMode = "verify", transpositionCache = None, **boardOptions)
+        board.initializeBoard()
+        for ply in range(0,len(games[name])):
+            if(not board.pushMove(games[name][ply])):
+                failures.append(name + ": move " + games[name][ply] + " refused at ply " + str(ply + 1))
+                break
+            #The lists of the side not to move are only refreshed when asked for
+            board.getNMoves(PieceColor.WHITE)
+            board.getNMoves(PieceColor.BLACK)
+        for mismatch in board.incrementalMismatches:
+            failures.append(name + ": incremental moves differ " + str(mismatch))
+
+    for name in PERFT_POSITIONS:
+        fen, knownCounts = PERFT_POSITIONS[name]
+        board = ChessBoard.fromFEN(fen, moveUpdateMode = "verify", transpositionCache = None, **boardOptions)
+        nodes = perft(board, perftDepth)
+        if(nodes != knownCounts[perftDepth - 1]):
+            failures.append(name + ": perft " + str(perftDepth) + " gives " + str(nodes) + " nodes instead of " + str(knownCounts[perftDepth - 1]))
+        for mismatch in board.incrementalMismatches:
+            failures.append(name + ": incremental moves differ " + str(mismatch))
+
+    generator = random.Random(seed)
+    for fen in DISAMBIGUATION_FENS + PROMOTION_FENS:
+        board = ChessBoard.fromFEN(fen, moveUpdateMode = "verify", transpositionCache = None, **boardOptions)
+        for ply in range(0,nRandomPlies):
+            legalMoves = sorted(legalMove[0] for legalMove in getLegalMoves(board))
+            if(board.gameEnded or len(legalMoves) == 0):
+                break
+            #pushMoveUCI prints the end of the game
+            with contextlib.redirect_stdout(io.StringIO()):
+                board.pushMoveUCI(legalMoves[generator.randrange(len(legalMoves))])
+            board.getNMoves(PieceColor.WHITE)
+            board.getNMoves(PieceColor.BLACK)
+        for mismatch in board.incrementalMismatches:
+            failures.append(fen + ": incremental moves differ " + str(mismatch))
+    return failures
+
+
+def checkNotationReplays(games, **boardOptions):
+    '''
+    Replays every game from its SAN moves (findMove) and again from the UCI moves
+    recorded on the way (findMoveUCI). Fails unless both give the same position and
+    vision graph after every ply, and getSANMoves of the UCI replay gives back the
+    SAN of the first one.
+    '''
+    failures = []
+    for name in games:
+        sanBoard = ChessBoard(**boardOptions)
+        sanBoard.initializeBoard()
+        positions = [sanBoard.toFEN()]
+        graphs = [ChessGraph(sanBoard, False, -1).adjacency]
+        for ply in range(0,len(games[name])):
+            if(not sanBoard.pushMove(games[name][ply])):
+                failures.append(name + ": SAN move " + games[name][ply] + " refused at ply " + str(ply + 1))
+                break
+            positions.append(sanBoard.toFEN())
+            graphs.append(ChessGraph(sanBoard, False, -1).adjacency)
+
+        uciBoard = ChessBoard(**boardOptions)
+        uciBoard.initializeBoard()
+        for ply in range(0,len(sanBoard.moveStack)):
+            uciMove = sanBoard.moveStack[ply].uciMove
+            if(not uciBoard.pushMoveUCI(uciMove)):
+                failures.append(name + ": UCI move " + uciMove + " refused at ply " + str(ply + 1))
+                break
+            if(uciBoard.toFEN() != positions[ply + 1]):
+                failures.append(name + ": positions differ after ply " + str(ply + 1) + ", " + uciBoard.toFEN() + " instead of " + positions[ply + 1])
+                break
+            if(not np.array_equal(ChessGraph(uciBoard, False, -1).adjacency, graphs[ply + 1])):
+                failures.append(name + ": vision graphs differ after ply " + str(ply + 1))
+                break
+
+        sanMoves = [move.moveString for move in sanBoard.executedMoves]
+        uciSANMoves = uciBoard.getSANMoves()
+        for ply in range(0,max(len(sanMoves), len(uciSANMoves))):
+            if(ply >= len(sanMoves) or ply >= len(uciSANMoves) or sanMoves[ply] != uciSANMoves[ply]):
+                failures.append(name + ": SAN of the UCI replay differs at ply " + str(ply + 1))
+                break
+    return failures
+
+
+def checkDisambiguation(**boardOptions):
+    '''
+    Plays every legal move of the DISAMBIGUATION_FENS positions from its SAN in the
+    move lists (findMove) and from its UCI (pushMoveUCI with getMoveSAN). Fails unless
+    both are accepted, give the same position and spell the move the same way.
+    '''
+    failures = []
+    for fen in DISAMBIGUATION_FENS:
+        board = ChessBoard.fromFEN(fen, **boardOptions)
+        for uciMove, move, pieces in getLegalMoves(board):
+            sanBoard = ChessBoard.fromFEN(fen, **boardOptions)
+            uciBoard = ChessBoard.fromFEN(fen, **boardOptions)
+            if(not sanBoard.pushMove(move.moveString)):
+                failures.append(fen + ": SAN move " + move.moveString + " refused")
+                continue
+            if(not uciBoard.pushMoveUCI(uciMove, True)):
+                failures.append(fen + ": UCI move " + uciMove + " refused")
+                continue
+            if(sanBoard.toFEN() != uciBoard.toFEN()):
+                failures.append(fen + ": " + move.moveString + " and " + uciMove + " give other positions")
+            elif(sanBoard.executedMoves[-1].moveString != uciBoard.executedMoves[-1].moveString):
+                failures.append(fen + ": " + uciMove + " is spelled " + move.moveString + " and " + uciBoard.executedMoves[-1].moveString)
+    return failures
+
+
+def checkFEN(games, **boardOptions):
+    '''
+    Fails unless the perft positions and CASTLING_FENS come back unchanged from
+    fromFEN and toFEN, every position of the games gives a FEN loading into the same
+    Zobrist key, FEN and legal moves, the CASTLING_FENS positions castle only as
+    their rights allow and every string of INVALID_FENS is refused
+    '''
+    failures = []
+    for name in PERFT_POSITIONS:
+        fen = PERFT_POSITIONS[name][0]
+        board = ChessBoard.fromFEN(fen, **boardOptions)
+        if(board is None or board.toFEN() != fen):
+            failures.append(name + ": FEN does not round trip")
+
+    for name in games:
+        board = ChessBoard(**boardOptions)
+        board.initializeBoard()
+        for ply in range(0,len(games[name]) + 1):
+            if(ply > 0 and not board.pushMove(games[name][ply - 1])):
+                failures.append(name + ": move " + games[name][ply - 1] + " refused at ply " + str(ply))
+                break
+            fen = board.toFEN()
+            loadedBoard = ChessBoard.fromFEN(fen, **boardOptions)
+            if(loadedBoard is None or loadedBoard.toFEN() != fen or loadedBoard.getZobristKey() != board.getZobristKey()):
+                failures.append(name + ": FEN " + fen + " of ply " + str(ply) + " does not round trip")
+                break
+            if(board.gameEnded):
+                continue
+            legalMoves = sorted(legalMove[0] for legalMove in getLegalMoves(board))
+            if(sorted(legalMove[0] for legalMove in getLegalMoves(loadedBoard)) != legalMoves):
+                failures.append(name + ": the board loaded from " + fen + " has other legal moves")
+                break
+
+    for fen in CASTLING_FENS:
+        board = ChessBoard.fromFEN(fen, **boardOptions)
+        if(board is None or board.toFEN() != fen):
+            failures.append(fen + ": FEN does not round trip")
+            continue
+        legalMoves = [legalMove[1].reducedString for legalMove in getLegalMoves(board)]
+        castlingMoves = {"O-O": "K", "O-O-O": "Q"}
+        for castlingMove in castlingMoves:
+            right = castlingMoves[castlingMove] if board.moveNumber % 2 == 0 else castlingMoves[castlingMove].lower()
+            if((castlingMove in legalMoves) != (right in fen.split()[2])):
+                failures.append(fen + ": " + castlingMove + (" generated" if castlingMove in legalMoves else " missing"))
+
+    for fen in INVALID_FENS:
+        #loadFEN prints why it refuses the string
+        with contextlib.redirect_stdout(io.StringIO()):
+            board = ChessBoard.fromFEN(fen, **boardOptions)
+        if(not board is None):
+            failures.append("invalid FEN accepted: " + fen)
+    return failures
+
+
+if __name__ == "__main__":
+    games = getBenchmarkGames()
+    failures = []
+    for visionBackend in VISION_BACKENDS:
+        checkFailures = checkIncrementalUpdates(games, visionBackend = visionBackend)
+        print("%-24s %-8s %s" % ("incremental updates", visionBackend, "OK" if len(checkFailures) == 0 else "FAIL"), flush = True)
+        failures.extend(checkFailures)
+        checkFailures = checkFEN(games, visionBackend = visionBackend)
+        print("%-24s %-8s %s" % ("FEN", visionBackend, "OK" if len(checkFailures) == 0 else "FAIL"), flush = True)
+        failures.extend(checkFailures)
+        checkFailures = checkNotationReplays(games, visionBackend = visionBackend)
+        print("%-24s %-8s %s" % ("SAN and UCI replays", visionBackend, "OK" if len(checkFailures) == 0 else "FAIL"), flush = True)
+        failures.extend(checkFailures)
+        checkFailures = checkDisambiguation(visionBackend = visionBackend)
+        print("%-24s %-8s %s" % ("SAN disambiguation", visionBackend, "OK" if len(checkFailures) == 0 else "FAIL"), flush = True)
+        failures.extend(checkFailures)
+    for failure in failures:
+        print("    " + failure)
+    sys.exit(1 if len(failures) > 0 else 0)
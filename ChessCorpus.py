@@ -0,0 +1,174 @@
+'''
+Per move metrics over a whole PGN corpus. Games are grouped in chunks which are
+replayed by a pool of worker processes and appended to a MetricsStore as soon as
+it is finished. The store remembers the finished chunks, so an interrupted run 
+can be resumed where it stopped.
+'''
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from ChessGame import PieceColor
+from ChessGraph import ChessGraph
+from ChessPGN import readPGNGames, replayPGNGame
+from ChessMetricsStore import MetricsStore
+
+#Columns written for each metric, with their types
+METRIC_COLUMNS = {"degree": [("whiteDegree", np.float32), ("blackDegree", np.float32)],
+                  "space": [("whiteSpace", np.int16), ("blackSpace", np.int16)],
+                  "material": [("material", np.int16)],
+                  "moves": [("whiteMoves", np.int16), ("blackMoves", np.int16)]}
+DEFAULT_METRICS = ["degree", "space", "material", "moves"]
+
+
+def computePlyMetrics(board, metrics):
+    '''
+    Values of the metric columns for the current position of a board
+    '''
+    values = {}
+    if("degree" in metrics):
+        values["whiteDegree"] = ChessGraph(board, True, PieceColor.WHITE).getAverageDegree()
+        values["blackDegree"] = ChessGraph(board, True, PieceColor.BLACK).getAverageDegree()
+    if("space" in metrics):
+        values["whiteSpace"] = board.getSpace(PieceColor.WHITE)
+        values["blackSpace"] = board.getSpace(PieceColor.BLACK)
+    if("material" in metrics):
+        values["material"] = board.getMaterial()
+    if("moves" in metrics):
+        values["whiteMoves"] = board.getNMoves(PieceColor.WHITE)
+        values["blackMoves"] = board.getNMoves(PieceColor.BLACK)
+    return values
+
+
+def getColumnTypes(metrics):
+    columnTypes = [("gameId", np.int64), ("ply", np.int16)]
+    for metric in metrics:
+        columnTypes.extend(METRIC_COLUMNS[metric])
+    return columnTypes
+
+
+def analyzeChunk(task):
+    '''
+    Worker side: replays the games of a chunk and returns its columns. task is
+    (chunkIndex, games, metrics) with games a list of PGNGame. A game that fails
+    has no rows, it is only listed in the failed games.
+    '''
+    chunkIndex, games, metrics = task
+    columnTypes = getColumnTypes(metrics)
+    columns = {name: [] for name, columnType in columnTypes}
+    failedGames = []
+
+    def onPly(board, ply, san):
+        columns["gameId"].append(gameId)
+        columns["ply"].append(ply)
+        values = computePlyMetrics(board, metrics)
+        for name in values:
+            columns[name].append(values[name])
+
+    for game in games:
+        gameId = game.gameId
+        nRows = len(columns["gameId"])
+        if(game.error is None):
+            replayPGNGame(game, onPly)
+        if(not game.error is None):
+            #The plies played before the illegal move are taken out
+            for name in columns:
+                del columns[name][nRows:]
+            failedGames.append((gameId, game.error))
+
+    arrays = {name: np.array(columns[name], dtype = columnType) for name, columnType in columnTypes}
+    return chunkIndex, arrays, failedGames, len(games)
+
+
+def iterateChunks(pgnSource, chunkSize):
+    '''
+    Groups the games of a PGN file in chunks of chunkSize games numbered from 0,
+    every game gets its position in the file as gameId
+    '''
+    chunk = []
+    chunkIndex = 0
+    for gameId, game in enumerate(readPGNGames(pgnSource)):
+        game.gameId = gameId
+        chunk.append(game)
+        if(len(chunk) == chunkSize):
+            yield chunkIndex, chunk
+            chunk = []
+            chunkIndex = chunkIndex + 1
+    if(len(chunk) > 0):
+        yield chunkIndex, chunk
+
+
+def analyzeCorpus(pgnSource, outputFolder, metrics = DEFAULT_METRICS, nWorkers = None, chunkSize = 100, resume = True, showProgress = True):
+    '''
+    Computes the per move metrics ("degree", "space", "material", "moves") of every
+    game of a PGN file with nWorkers processes (all the cores by default) into the
+    MetricsStore in outputFolder. Chunks the store already holds are skipped when
+    resume is True (chunkSize has to be the one of the first run), otherwise every
+    chunk is computed into an emptied store. Returns the number of games and plies
+    processed in this run, -1 if the store can not take the metrics.
+    '''
+    columnTypes = getColumnTypes(metrics)
+    store = MetricsStore(outputFolder)
+    #A store with nothing written yet takes the metric columns
+    if(not resume or (store.nRows == 0 and len(store.metadata) == 0)):
+        store.clear(columnTypes)
+    if(store.getColumnNames() != [name for name, columnType in columnTypes]):
+        print("The store in " + outputFolder + " holds other metrics, use resume = False to start it over")
+        return -1
+    completedChunks = set(store.metadata.get("completedChunks", []))
+    failedGames = store.metadata.get("failedGames", [])
+    if(nWorkers is None):
+        nWorkers = os.cpu_count()
+    #Chunks handed to the pool at once, the rest of the file is not read ahead
+    maxPending = 2*nWorkers
+
+    nGames = 0
+    nPlies = 0
+    nFailed = 0
+    startTime = time.time()
+    with ProcessPoolExecutor(max_workers = nWorkers) as pool:
+        pending = set()
+
+        def collect(doneFutures):
+            '''
+            Appends the finished chunks to the store, False if one could not be written
+            '''
+            nonlocal nGames, nPlies, nFailed
+            for future in doneFutures:
+                chunkIndex, arrays, chunkFailedGames, nChunkGames = future.result()
+                metadata = {"completedChunks": sorted(completedChunks | {chunkIndex}), "failedGames": failedGames + chunkFailedGames}
+                if(store.append(arrays, metadata) == -1):
+                    print("Chunk " + str(chunkIndex) + " could not be written, the run stops")
+                    return False
+                completedChunks.add(chunkIndex)
+                failedGames.extend(chunkFailedGames)
+                nGames = nGames + nChunkGames
+                nPlies = nPlies + len(arrays["ply"])
+                nFailed = nFailed + len(chunkFailedGames)
+                if(showProgress):
+                    elapsed = time.time() - startTime
+                    print("Games %d, plies %d, failed %d, %.1f plies/s" % (nGames, nPlies, nFailed, nPlies/max(elapsed, 1e-9)), flush = True)
+            return True
+
+        for chunkIndex, games in iterateChunks(pgnSource, chunkSize):
+            if(chunkIndex in completedChunks):
+                continue
+            pending.add(pool.submit(analyzeChunk, (chunkIndex, games, metrics)))
+            if(len(pending) >= maxPending):
+                doneFutures, pending = wait(pending, return_when = FIRST_COMPLETED)
+                if(not collect(doneFutures)):
+                    pool.shutdown(cancel_futures = True)
+                    return -1
+
+        doneFutures, pending = wait(pending)
+        if(not collect(doneFutures)):
+            return -1
+
+    return nGames, nPlies
+
+
+def loadCorpusMetrics(outputFolder, names = None):
+    '''
+    Memory maps of the requested metric columns of a corpus run (all by default)
+    '''
+    return MetricsStore(outputFolder).loadColumns(names)
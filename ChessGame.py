@@ -1,10 +1,14 @@
 from enum import Enum
+import re
 import numpy as np
 import matplotlib.pyplot as plt
-import copy
 from PIL import Image
-from matplotlib.offsetbox import (OffsetImage, AnnotationBbox)
-from matplotlib.patches import Rectangle
+from matplotlib.colors import to_rgb
+from ChessProfiling import BoardProfiler, PROFILED_METHODS
+from ChessHashing import ZOBRIST_PIECES, ZOBRIST_UNMOVED, ZOBRIST_SIDE, ZOBRIST_EN_PASSANT, CASTLING_RIGHTS, sharedTranspositionCache
+from ChessBitboard import (KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, PAWN_PUSHES, RANK_MASKS, RAYS, DIRECTION_TABLE, BETWEEN, FULL_BOARD,
+                           getPieceAttacks, getPawnPushes, getBishopAttacks, getRookAttacks, getLowestSquare, getSquareIndices,
+                           countSquares)
 
 class PieceImageRenderer:
     
@@ -29,6 +33,120 @@ class PieceImageRenderer:
         image = Image.open(urlImage)
         return image.resize((width, height))
     
+    def getPieceSprite(self, width, height, pieceType, pieceColor):
+        #RGBA array of the image, cached and read-only (see getPieceSprite)
+        return getPieceSprite(pieceType, pieceColor, width, height, self.imageFolder)
+
+
+#Resized piece images as RGBA arrays by (image folder, type, color, width, height),
+#each file is read once per process
+PIECE_SPRITES = {}
+
+def getPieceSprite(pieceType, pieceColor, width = 200, height = 200, imageFolder = "PieceImages"):
+    key = (imageFolder, pieceType, pieceColor, width, height)
+    sprite = PIECE_SPRITES.get(key)
+    if(sprite is None):
+        image = Image.open(imageFolder + "/" + pieceColor.name.lower() + "_" + pieceType.name.lower() + ".png")
+        sprite = np.array(image.convert("RGBA").resize((width, height)))
+        #Shared by every figure using it
+        sprite.flags.writeable = False
+        PIECE_SPRITES[key] = sprite
+    return sprite
+
+
+class BoardFigure:
+    '''
+    A board drawing kept from one position to the next. The squares are a single
+    image drawn once and every square has its own piece image, whose data only
+    changes when the piece on the square does. With a canvas that can blit, a new
+    position is shown by drawing the pieces over the saved empty board.
+    '''
+
+    def __init__(self, whiteColor = "#f2dbc4", blackColor = "#c9782c", ax = None, figureSize = 4, imageFolder = "PieceImages", spriteSize = 64):
+        if(ax is None):
+            fig, ax = plt.subplots(figsize = (figureSize, figureSize))
+        self.fig = ax.figure
+        self.ax = ax
+        self.imageFolder = imageFolder
+        self.spriteSize = spriteSize
+
+        #Rows are ranks and columns files, a1 is a dark square
+        lightSquares = np.add.outer(np.arange(8), np.arange(8)) % 2
+        squareColors = np.array([to_rgb(blackColor), to_rgb(whiteColor)])
+        ax.imshow(squareColors[lightSquares], extent = (0, 8, 0, 8), origin = "lower", interpolation = "nearest", zorder = 0)
+
+        ticksArray = ["a","b","c","d","e","f","g","h"]
+        ticksPositions = np.arange(0.5,8,1)
+        ticksArray2 = np.arange(1,9,1)
+        ax.set_xticks(ticksPositions)
+        ax.set_xticklabels(ticksArray)
+        ax.set_yticks(ticksPositions)
+        ax.set_yticklabels(ticksArray2)
+        ax.set_xlim([0,8])
+        ax.set_ylim([0,8])
+        ax.set_autoscale_on(False)
+
+        #Piece image of each square (None until a piece stands there) and the (type, color) it shows
+        self.pieceImages = [None]*64
+        self.shownPieces = [None]*64
+        #Canvas region of the board without pieces and the canvas size it was taken at
+        self.background = None
+        self.backgroundSize = None
+
+    def update(self, board):
+        '''
+        Shows the pieces of board, returns the piece images that changed
+        '''
+        changedImages = []
+        for square in range(0,64):
+            piece = board.squares[square]
+            shownPiece = None if piece is None else (piece.pieceType, piece.pieceColor)
+            if(shownPiece == self.shownPieces[square]):
+                continue
+            self.shownPieces[square] = shownPiece
+            pieceImage = self.pieceImages[square]
+            if(shownPiece is None):
+                pieceImage.set_visible(False)
+            else:
+                sprite = getPieceSprite(piece.pieceType, piece.pieceColor, self.spriteSize, self.spriteSize, self.imageFolder)
+                if(pieceImage is None):
+                    file = square % 8
+                    rank = square // 8
+                    pieceImage = self.ax.imshow(sprite, extent = (file + 0.1, file + 0.9, rank + 0.1, rank + 0.9), zorder = 2)
+                    self.pieceImages[square] = pieceImage
+                else:
+                    pieceImage.set_data(sprite)
+                    pieceImage.set_visible(True)
+            changedImages.append(pieceImage)
+        return changedImages
+
+    def draw(self):
+        '''
+        Renders the current pieces on the canvas of the figure
+        '''
+        canvas = self.fig.canvas
+        if(not canvas.supports_blit):
+            canvas.draw_idle()
+            return
+
+        canvasSize = canvas.get_width_height()
+        visibleImages = [pieceImage for pieceImage in self.pieceImages if not pieceImage is None and pieceImage.get_visible()]
+        if(self.background is None or self.backgroundSize != canvasSize):
+            #A full draw of the empty board, saved to draw the pieces over it
+            for pieceImage in visibleImages:
+                pieceImage.set_visible(False)
+            canvas.draw()
+            self.background = canvas.copy_from_bbox(self.ax.bbox)
+            self.backgroundSize = canvasSize
+            for pieceImage in visibleImages:
+                pieceImage.set_visible(True)
+        else:
+            canvas.restore_region(self.background)
+
+        for pieceImage in visibleImages:
+            self.ax.draw_artist(pieceImage)
+        canvas.blit(self.ax.bbox)
+
 
 class PieceType(Enum):
     PAWN = ""
@@ -42,11 +160,31 @@ class PieceColor(Enum):
     WHITE = 0
     BLACK = 1
 
+FILE_NAMES = ["a", "b", "c", "d", "e", "f", "g", "h"]
+RANK_NAMES = ["1", "2", "3", "4", "5", "6", "7", "8"]
+
+#Kinds of relation between a piece and a square, as given by getTypedVisionBitboards
+EDGE_TYPES = ["move", "capture", "defend", "xray"]
+
+#Squares are indexed from 0 (a1) to 63 (h8), file first
+SQUARE_INDEX = {}
+for rankIndex in range(0,8):
+    for fileIndex in range(0,8):
+        SQUARE_INDEX[FILE_NAMES[fileIndex] + RANK_NAMES[rankIndex]] = fileIndex + 8*rankIndex
+
 class ChessCoordinateTranslator:
+    '''
+    Conversions between chess notation and matrix or image coordinates. The answers
+    are looked up in tables shared by every translator, use COORDINATE_TRANSLATOR
+    instead of creating new ones.
+    '''
     
-    def __init__(self):
-        self.fileNames = ["a", "b", "c", "d", "e", "f", "g", "h"]
-        self.rankNames = ["1","2","3","4","5","6","7","8"]
+    fileNames = FILE_NAMES
+    rankNames = RANK_NAMES
+    #(row, col) of each square name, rows going from rank 8 (0) to rank 1 (7)
+    matrixCoordinates = {FILE_NAMES[col] + RANK_NAMES[7 - row]: (row, col) for row in range(0,8) for col in range(0,8)}
+    #(file, rank) of each (row, col)
+    notationCoordinates = [[(FILE_NAMES[col], RANK_NAMES[7 - row]) for col in range(0,8)] for row in range(0,8)]
     
     def getMatrixCoordinates(self, file, rank):
         '''
@@ -55,53 +193,60 @@ class ChessCoordinateTranslator:
         a-h go to 0-7
         1-8 go to 7-0 (y-axis is inverted)
         '''
-        row = -1
-        col = -1
-        for i in range(0,len(self.fileNames)):
-            if(self.fileNames[i] == file):
-                col = i
-                break
-        
-        row = 8-int(rank)
-        
-        return [row, col]
+        return self.matrixCoordinates[file + rank]
     
     def getChessNotationCoordinates(self, row, col):
         '''
         Gets chess notation coordinates from matrix coordinates
         '''
-        file = self.fileNames[col]
-        rank = self.rankNames[7-row]
-        return [file, rank]
+        return self.notationCoordinates[row][col]
     
     def getImageCoordinates(self, file, rank):
-        row = -1
-        col = -1
-        for i in range(0,len(self.fileNames)):
-            if(self.fileNames[i] == file):
-                col = i
-                break
-        
-        row = int(rank)-1
-        
-        return [row, col]
-        
+        row, col = self.matrixCoordinates[file + rank]
+        return (7 - row, col)
+
+COORDINATE_TRANSLATOR = ChessCoordinateTranslator()
 
-    
 class ChessMove:
     
-    def __init__(self, moveString):
+    __slots__ = ("moveString", "takes", "check", "checkMate", "annotated", "statusKey", "reducedString", "finalPosition", "promotion", "targetKey")
+    specialSymbols = ["x", "+", "#", "=", "N", "Q", "K", "R", "B"]
+    #Deletes the special symbols in one pass
+    reduceTable = str.maketrans("", "", "x+#=NQKRB")
+    
+    def __init__(self, moveString, annotated = True):
+        '''
+        annotated tells if the string carries the check and checkmate marks of the
+        move, otherwise they are found when needed by ChessBoard.getCheckStatus
+        '''
+        self.annotated = annotated
+        self.statusKey = None
+        self.setMoveString(moveString)
+    
+    def setMoveString(self, moveString):
+        '''
+        Sets the move string and the fields parsed from it
+        '''
         self.moveString = moveString
-        self.specialSymbols =["x", "+", "#", "=", "N", "Q", "K", "R", "B"]
-        self.takes = "x" in self.moveString
-        self.check = "+" in self.moveString
-        self.checkMate = "#" in self.moveString
+        self.takes = "x" in moveString
+        self.check = "+" in moveString
+        self.checkMate = "#" in moveString
+        self.reducedString = moveString.translate(self.reduceTable)
+        self.finalPosition = (self.reducedString[-2:-1], self.reducedString[-1:])
+        self.promotion = ""
+        if("=" in moveString):
+            self.promotion = moveString.split("=")[1][0:1]
+        #Same for every spelling of the move of a given piece (disambiguation, check marks)
+        if(moveString.startswith("O-O")):
+            self.targetKey = self.reducedString
+        else:
+            self.targetKey = self.finalPosition + (self.promotion,)
     
     @classmethod
-    def fromChessCoordinates(cls, pieceType, fromFile, fromRank, toFile, toRank, takes, castleMove, promotionPiece, check, checkmate):
+    def fromChessCoordinates(cls, pieceType, fromFile, fromRank, toFile, toRank, takes, castleMove, promotionPiece, check, checkmate, annotated = True):
         if(castleMove == "O-O-O" or castleMove == "O-O"):
             moveString = castleMove + checkmate + check
-            return cls(moveString)
+            return cls(moveString, annotated)
         
         else:
             moveString = pieceType + fromFile + fromRank + takes + toFile + toRank
@@ -111,39 +256,43 @@ class ChessMove:
             
             moveString = moveString + checkmate + check
             
-            return cls(moveString)
+            return cls(moveString, annotated)
         
     
     def specifyFromPosition(self, file, rank):
+        '''
+        Replaces the disambiguation of a piece move by file and rank (either can be "")
+        '''
         if(self.moveString[0] in ["N", "Q", "K", "R", "B"]):
-            self.moveString = self.moveString[0] + file + rank +self.moveString[1:]
+            #The reduced string is the disambiguation followed by the destination
+            nSpecified = len(self.reducedString) - 2
+            self.setMoveString(self.moveString[0] + file + rank + self.moveString[1 + nSpecified:])
         
     def __eq__(self, other):
         return self.moveString == other.moveString
     
     def reduceMoveString(self,moveString):
-        reducedString = moveString
-        for i in range(0,len(self.specialSymbols)):
-            reducedString = reducedString.replace(self.specialSymbols[i], "")
-        
-        return reducedString
+        if(moveString == self.moveString):
+            return self.reducedString
+        return moveString.translate(self.reduceTable)
         
-    def executeMove(self, piece):
+    def executeMove(self, piece, board = None):
         '''
         Moves a piece into the position indicated by the move. The method also throws 
         indicators tha tells if a piece has been taken, and if there's a check or a
         checkmate. 
         '''
         
-        takes = False
-        check = False
+        takes = self.takes
+        check = self.check
+        checkMate = self.checkMate
         
-        takes = "x" in self.moveString
-        check = "+" in self.moveString
-        checkMate = "#" in self.moveString
+        #Keep the board square index in sync with the piece position
+        if(not board is None):
+            board.clearSquare(piece.file, piece.rank)
         
         #Castling short
-        reducedString = self.reduceMoveString(self.moveString)
+        reducedString = self.reducedString
         if(reducedString =="O-O"):
             if(piece.pieceType == PieceType.KING):
                 piece.setPosition("g",piece.rank)
@@ -175,32 +324,28 @@ class ChessMove:
             newPosition = self.getPieceFinalPosition()
             piece.setPosition(newPosition[0],newPosition[1])
         
+        if(not board is None):
+            board.setSquare(piece.file, piece.rank, piece)
+        
         #Increment the number of moves of the piece
         piece.increaseMoveCounter()
             
         return takes, check, checkMate
     
     def getPieceFinalPosition(self):
-        reducedString = self.reduceMoveString(self.moveString)
-        file = reducedString[-2]
-        rank = reducedString[-1]
-            
-        
-        return [file, rank]
-        
-        
-            
+        return self.finalPosition
     
     
 class ChessPiece:
     
+    __slots__ = ("pieceType", "file", "rank", "squareIndex", "pieceColor", "pieceMoves", "movesByTarget", "moveCounter", "winner")
+    
     def __init__(self, pieceType, pieceColor, file, rank):
         
         self.pieceType = pieceType
-        self.file = file
-        self.rank = rank
         self.pieceColor = pieceColor
-        self.pieceMoves = []
+        self.setPosition(file, rank)
+        self.setPieceMoves([])
         self.moveCounter = 0
         self.winner = -1
     
@@ -225,6 +370,10 @@ class ChessPiece:
     def setPosition(self, file, rank):
         self.file = file
         self.rank = rank
+        self.squareIndex = SQUARE_INDEX[file + rank]
+    
+    def getSquareIndex(self):
+        return self.squareIndex
         
     def setPieceType(self, pieceType):
         self.pieceType = pieceType
@@ -236,51 +385,45 @@ class ChessPiece:
         self.moveCounter = self.moveCounter + 1
         
     def addMove(self, move):
-        if(not move in self.pieceMoves):
+        if(not move.targetKey in self.movesByTarget):
+            self.movesByTarget[move.targetKey] = move
             self.pieceMoves.append(move)
     
+    def setPieceMoves(self, pieceMoves):
+        self.pieceMoves = pieceMoves
+        #Moves by destination and promotion (or castling side), see ChessMove.targetKey
+        self.movesByTarget = {move.targetKey: move for move in pieceMoves}
+    
     def resetPieceMoves(self):
-        self.pieceMoves = []
+        self.setPieceMoves([])
     
     def computePieceMoves(self, board, checkGlobal, checkmateGlobal):
         #If checkmate has been played there are no moves left!, Game Over
         
         if(checkmateGlobal):
-            self.pieceMoves = []
+            self.resetPieceMoves()
         
         #We want to do moves that get the king out of check. 
         elif(checkGlobal):
             fileVision, rankVision, takesArray = board.getPieceBoardVision(self.pieceType, self.file, self.rank, self.moveCounter, self.pieceColor)
             for i in range(0,len(fileVision)):
                 #Which of these moves get us out of check
-                if(not board.isKingInCheckAfterMoving(self, self.pieceType, fileVision[i], rankVision[i], self.pieceColor)):
+                if(board.isMoveLegal(self, fileVision[i], rankVision[i])):
                     
                     pieceType = self.pieceType.value
                     
                     file = fileVision[i]
                     rank = rankVision[i]
                     
-                    isDestinationShared, otherPieceFile, otherPieceRank, conflictMove = board.isDestinationSquareShared(self, self.pieceType, self.pieceColor, file, rank)
+                    sharingPieces = board.getPiecesSharingDestination(self, file, rank)
                     
-                    if(isDestinationShared):
-                        if(otherPieceFile != file and otherPieceRank != rank):
-                            otherPieceRank = ""
-                        
-                        
-                        elif(otherPieceFile == file):
-                            otherPieceFile = ""
-                        
-                        elif(otherPieceRank == rank):
-                            otherPieceRank = ""
-                        
-                        conflictMove.specifyFromPosition(otherPieceFile, otherPieceRank)
+                    #Every move to the square is told apart from all the others, so the ones found before are spelled again
+                    for sharingPiece, sharingMove in sharingPieces:
+                        otherPieces = [self] + [otherPiece for otherPiece, otherMove in sharingPieces if not otherPiece is sharingPiece]
+                        otherPieceFile, otherPieceRank = board.getDisambiguation(sharingPiece, otherPieces)
+                        sharingMove.specifyFromPosition(otherPieceFile, otherPieceRank)
+                    fromFile, fromRank = board.getDisambiguation(self, [sharingPiece for sharingPiece, sharingMove in sharingPieces])
                     
-                    fromFile = ""
-                    fromRank = ""
-                    if(isDestinationShared and otherPieceFile != ""):
-                        fromFile = self.file
-                    if(isDestinationShared and otherPieceRank != ""):
-                        fromRank = self.rank
                     
                     
                         
@@ -296,7 +439,7 @@ class ChessPiece:
                     if(self.pieceType == PieceType.PAWN and (rank == "8" or rank == "1")):
                         pieceLetters = ["Q", "R", "B", "N"]
                         for j in range(0,len(pieceLetters)):
-                            checkCondition, checkmateCondition = board.isEnemyKingCheckmatedAfterMove(self,PieceType(pieceLetters[j]), file, rank, self.pieceColor, checkGlobal)
+                            checkCondition, checkmateCondition = board.getMoveAnnotation(self,PieceType(pieceLetters[j]), file, rank, self.pieceColor, checkGlobal)
                             check = ""
                             checkmate = ""
                             if(checkmateCondition):
@@ -304,19 +447,19 @@ class ChessPiece:
                             elif(checkCondition):
                                 check = "+"
                             
-                            move = ChessMove.fromChessCoordinates(pieceType, fromFile, fromRank, file, rank, takes, castleMove, pieceLetters[j], check, checkmate)
+                            move = ChessMove.fromChessCoordinates(pieceType, fromFile, fromRank, file, rank, takes, castleMove, pieceLetters[j], check, checkmate, board.annotateMoves)
                             self.addMove(move)
                     else:
                         promotion = ""
                         check = ""
                         checkmate = ""
-                        checkCondition, checkmateCondition = board.isEnemyKingCheckmatedAfterMove(self, self.pieceType, file, rank, self.pieceColor, checkGlobal)
+                        checkCondition, checkmateCondition = board.getMoveAnnotation(self, self.pieceType, file, rank, self.pieceColor, checkGlobal)
                         if(checkmateCondition):
                             checkmate = "#"
-                        elif(check):
+                        elif(checkCondition):
                             check = "+"
                             
-                        move = ChessMove.fromChessCoordinates(pieceType, fromFile, fromRank, file, rank, takes, castleMove, promotion, check, checkmate)
+                        move = ChessMove.fromChessCoordinates(pieceType, fromFile, fromRank, file, rank, takes, castleMove, promotion, check, checkmate, board.annotateMoves)
                         #print(move.moveString)
                         self.addMove(move)
                         
@@ -330,7 +473,7 @@ class ChessPiece:
                 rank = rankVision[i]
                 #Castle king case 
                 
-                if(self.pieceType == PieceType.KING and not board.isKingInCheckAfterMoving(self, self.pieceType, fileVision[i], rankVision[i], self.pieceColor) and ((self.file == "e" and file == "g") or (self.file == "e" and file == "c"))):
+                if(self.pieceType == PieceType.KING and board.isMoveLegal(self, fileVision[i], rankVision[i]) and ((self.file == "e" and file == "g") or (self.file == "e" and file == "c"))):
                     castleMove = ""
                     #Castling short case
                     if(self.file == "e" and file == "g"):
@@ -338,13 +481,13 @@ class ChessPiece:
                         check = ""
                         checkmate = ""
                         rook = board.getPieceAtPosition("h",self.rank)
-                        checkCondition, checkmateCondition = board.isEnemyKingCheckmatedAfterMove(rook, rook.pieceType,"f", rook.rank, self.pieceColor,checkGlobal)
+                        checkCondition, checkmateCondition = board.getMoveAnnotation(rook, rook.pieceType,"f", rook.rank, self.pieceColor,checkGlobal)
                         if(checkmateCondition):
                             checkmate = "#"
-                        elif(check):
+                        elif(checkCondition):
                             check = "+"
                         
-                        move = ChessMove.fromChessCoordinates("", "", "", "", "", "", castleMove, "", check, checkmate)
+                        move = ChessMove.fromChessCoordinates("", "", "", "", "", "", castleMove, "", check, checkmate, board.annotateMoves)
                         rook.addMove(move)
                         self.addMove(move)
                     elif(self.file == "e" and file == "c"):
@@ -352,17 +495,17 @@ class ChessPiece:
                         check = ""
                         checkmate = ""
                         rook = board.getPieceAtPosition("a",self.rank)
-                        checkCondition, checkmateCondition = board.isEnemyKingCheckmatedAfterMove(rook, rook.pieceType,"d", rook.rank, self.pieceColor, checkGlobal)
+                        checkCondition, checkmateCondition = board.getMoveAnnotation(rook, rook.pieceType,"d", rook.rank, self.pieceColor, checkGlobal)
                         if(checkmateCondition):
                             checkmate = "#"
-                        elif(check):
+                        elif(checkCondition):
                             check = "+"
-                        move = ChessMove.fromChessCoordinates("", "", "", "", "", "", castleMove, "", check, checkmate)
+                        move = ChessMove.fromChessCoordinates("", "", "", "", "", "", castleMove, "", check, checkmate, board.annotateMoves)
                         rook.addMove(move)
                         self.addMove(move)
       
                 #Pawn promotion
-                elif(self.pieceType == PieceType.PAWN and (rank == "1" or rank == "8") and not board.isKingInCheckAfterMoving(self, self.pieceType, fileVision[i], rankVision[i], self.pieceColor)):
+                elif(self.pieceType == PieceType.PAWN and (rank == "1" or rank == "8") and board.isMoveLegal(self, fileVision[i], rankVision[i])):
                     
                     castleMove = ""
                     otherPieceFile = ""
@@ -375,7 +518,7 @@ class ChessPiece:
                     
                     pieceLetters = ["Q", "R", "B", "N"]
                     for j in range(0,len(pieceLetters)):
-                        checkCondition, checkmateCondition = board.isEnemyKingCheckmatedAfterMove(self, PieceType(pieceLetters[j]), file, rank, self.pieceColor, checkGlobal)
+                        checkCondition, checkmateCondition = board.getMoveAnnotation(self, PieceType(pieceLetters[j]), file, rank, self.pieceColor, checkGlobal)
                         check = ""
                         checkmate = ""
                         if(checkmateCondition):
@@ -383,35 +526,23 @@ class ChessPiece:
                         elif(checkCondition):
                             check = "+"
                             
-                        move = ChessMove.fromChessCoordinates(pieceType, otherPieceFile, otherPieceRank, file, rank, takes, castleMove, pieceLetters[j], check, checkmate)
+                        move = ChessMove.fromChessCoordinates(pieceType, otherPieceFile, otherPieceRank, file, rank, takes, castleMove, pieceLetters[j], check, checkmate, board.annotateMoves)
                         self.addMove(move)
                 
                 
                 
-                elif(not board.isKingInCheckAfterMoving(self, self.pieceType, fileVision[i], rankVision[i], self.pieceColor)):
+                elif(board.isMoveLegal(self, fileVision[i], rankVision[i])):
 
-                    isDestinationShared, otherPieceFile, otherPieceRank, conflictingMove = board.isDestinationSquareShared(self, self.pieceType, self.pieceColor, file, rank)
+                    sharingPieces = board.getPiecesSharingDestination(self, file, rank)
                     
-                    if(isDestinationShared):
-                        if(otherPieceFile != file and otherPieceRank != rank):
-                            otherPieceRank = ""
-                        
-                        
-                        elif(otherPieceFile == file):
-                            otherPieceFile = ""
-                        
-                        elif(otherPieceRank == rank):
-                            otherPieceRank = ""
-                        
-                        conflictingMove.specifyFromPosition(otherPieceFile, otherPieceRank)
+                    #Every move to the square is told apart from all the others, so the ones found before are spelled again
+                    for sharingPiece, sharingMove in sharingPieces:
+                        otherPieces = [self] + [otherPiece for otherPiece, otherMove in sharingPieces if not otherPiece is sharingPiece]
+                        otherPieceFile, otherPieceRank = board.getDisambiguation(sharingPiece, otherPieces)
+                        sharingMove.specifyFromPosition(otherPieceFile, otherPieceRank)
+                    fromFile, fromRank = board.getDisambiguation(self, [sharingPiece for sharingPiece, sharingMove in sharingPieces])
                         
                     
-                    fromFile = ""
-                    fromRank = ""
-                    if(isDestinationShared and otherPieceFile != ""):
-                        fromFile = self.file
-                    if(isDestinationShared and otherPieceRank != ""):
-                        fromRank = self.rank
                         
                     
                     takes = ""
@@ -422,7 +553,7 @@ class ChessPiece:
                     
                     castleMove = ""
                     
-                    checkCondition, checkmateCondition = board.isEnemyKingCheckmatedAfterMove(self,self.pieceType, file, rank, self.pieceColor, checkGlobal)
+                    checkCondition, checkmateCondition = board.getMoveAnnotation(self,self.pieceType, file, rank, self.pieceColor, checkGlobal)
                     check = ""
                     checkmate = ""
                     promotion = ""
@@ -431,18 +562,152 @@ class ChessPiece:
                     elif(checkCondition):
                         check = "+"
                             
-                    move = ChessMove.fromChessCoordinates(pieceType, fromFile, fromRank, file, rank, takes, castleMove,promotion , check, checkmate)
+                    move = ChessMove.fromChessCoordinates(pieceType, fromFile, fromRank, file, rank, takes, castleMove,promotion , check, checkmate, board.annotateMoves)
                     self.addMove(move)
 
+def getCanonicalSAN(moveString):
+    '''
+    SAN without check marks, annotations, capture and promotion signs: the same
+    key for "Nxe5+", "Ne5" or "Nxe5!?"
+    '''
+    moveString = moveString.strip().replace("e.p.", "")
+    if(moveString.startswith("0")):
+        moveString = moveString.replace("0", "O")
+    return moveString.rstrip("+#!? ").replace("x", "").replace("=", "")
+
+SAN_PATTERN = re.compile(r'^([NBRQK]?)([a-h]?)([1-8]?)([a-h][1-8])([NBRQ]?)$')
+
+def parseSAN(canonicalSAN):
+    '''
+    (piece letter, origin file, origin rank, destination, promotion) of a canonical
+    SAN move, None for castling or unreadable moves
+    '''
+    match = SAN_PATTERN.match(canonicalSAN)
+    if(match is None):
+        return None
+    return match.groups()
+
+UCI_PATTERN = re.compile(r'^([a-h][1-8])([a-h][1-8])([nbrqNBRQ]?)$')
+
+def parseUCI(uciMove):
+    '''
+    (origin, destination, promotion letter) of a move in UCI notation ("e2e4", 
+    "e7e8q"), None if unreadable
+    '''
+    match = UCI_PATTERN.match(uciMove.strip())
+    if(match is None):
+        return None
+    return match.group(1), match.group(2), match.group(3).upper()
+
+
+class MoveUndoRecord:
+    '''
+    Compact record of a played move: the pieces it moved with their previous square,
+    type and move counter, the taken piece, the promotion type, the castling rook, 
+    the en passant victim and the board state popMove has to put back.
+    '''
+    
+    def __init__(self, move, board):
+        self.move = move
+        self.movedPieces = []
+        self.capturedPiece = None
+        self.capturedIndex = -1
+        self.promotionType = None
+        self.castlingRook = None
+        self.enPassantVictim = None
+        self.previousMoveLists = []
+        #The move in UCI notation, to play it again (see getSANMoves)
+        self.uciMove = ""
+        self.longNotation = False
+        
+        self.moveNumber = board.moveNumber
+        self.gameEnded = board.gameEnded
+        self.winner = board.winner
+        self.nExecutedMoves = len(board.executedMoves)
+        self.dirtySquares = list(board.dirtySquares)
+        self.dirtyTypes = [set(board.dirtyTypes[0]), set(board.dirtyTypes[1])]
+        self.needsFullUpdate = list(board.needsFullUpdate)
+        self.pendingMoveUpdates = list(board.pendingMoveUpdates)
+        self.enPassantSquare = board.enPassantSquare
+        self.halfmoveClock = board.halfmoveClock
+    
+    def restoreBoardState(self, board):
+        board.moveNumber = self.moveNumber
+        board.toMoveColor = PieceColor(self.moveNumber % 2)
+        board.gameEnded = self.gameEnded
+        board.winner = self.winner
+        del board.executedMoves[self.nExecutedMoves:]
+        board.dirtySquares = self.dirtySquares
+        board.dirtyTypes = self.dirtyTypes
+        board.needsFullUpdate = self.needsFullUpdate
+        board.pendingMoveUpdates = self.pendingMoveUpdates
+        board.enPassantSquare = self.enPassantSquare
+        board.halfmoveClock = self.halfmoveClock
+        
+    
 class ChessBoard:
     
-    def __init__(self):
+    def __init__(self, visionBackend = "bitboard", moveUpdateMode = "incremental", transpositionCache = sharedTranspositionCache, moveAnnotation = "lazy", profiling = False):
+        '''
+        visionBackend selects how piece vision and attacks are computed: "bitboard"
+        (precomputed attack tables) or "mailbox" (square by square walks).
+        
+        moveUpdateMode selects how the moves of the side to move are refreshed after
+        each move: "incremental" (only the pieces the move can affect), "full" (every 
+        piece) or "verify" (both, recording differences in incrementalMismatches).
+        
+        transpositionCache keeps move lists and graph metrics per Zobrist key, by 
+        default shared with the other boards. None turns the caching off.
+        
+        moveAnnotation selects when generated moves get their check and checkmate
+        marks: "lazy" (only when asked for, see getCheckStatus) or "eager" (every
+        move, for fully annotated SAN in the move lists).
+        
+        profiling counts the calls and time of the costly methods, see enableProfiling.
+        '''
+        self.visionBackend = visionBackend
+        self.moveUpdateMode = moveUpdateMode
+        self.annotateMoves = moveAnnotation == "eager"
+        #Squares and taken piece types that changed since each side's moves were computed
+        self.dirtySquares = [FULL_BOARD, FULL_BOARD]
+        self.dirtyTypes = [set(), set()]
+        self.needsFullUpdate = [True, True]
+        #Sides whose moves were not recomputed after a pushMoveUCI, see ensureSideMoves
+        self.pendingMoveUpdates = [False, False]
+        self.incrementalMismatches = []
         self.pieces = []
         self.moveNumber = 0
         self.blackColor = "#c9782c"
         self.whiteColor = "#f2dbc4"
+        #Figure of the last drawBoard call
+        self.boardFigure = None
         self.gameEnded = False
+        self.winner = -1
         self.executedMoves = []
+        #Square a pawn just passed with a double step (-1 if none), it can be taken there en passant
+        self.enPassantSquare = -1
+        #Plies since the last capture or pawn move
+        self.halfmoveClock = 0
+        #Undo records of the moves played, see pushMove and popMove
+        self.moveStack = []
+        #Piece standing on each square, indexed as in SQUARE_INDEX
+        self.squares = [None]*64
+        #Occupancy per color (PieceColor.value) and per piece type (PieceType.value)
+        self.colorBitboards = [0, 0]
+        self.typeBitboards = {"": 0, "R": 0, "N": 0, "Q": 0, "B": 0, "K": 0}
+        self.legalityMasks = [None, None]
+        #Zobrist key of the piece placement, kept up to date by setSquare and clearSquare
+        self.placementHash = 0
+        self.transpositionCache = transpositionCache
+        #Moves of each side by canonical SAN, see getMoveIndex
+        self.moveIndex = [None, None]
+        #Checkmate answers per (placement hash, side in check)
+        self.mateCache = {}
+        self.mateCacheSize = 100000
+        #Call counts and timings, see enableProfiling
+        self.profiler = None
+        if(profiling):
+            self.enableProfiling()
     
     def getMaterial(self):
         
@@ -474,6 +739,18 @@ class ChessBoard:
             enemyRanks = ["1","2","3","4"]
         
         nPieces = len(self.pieces)
+        if(self.visionBackend == "bitboard"):
+            enemyHalf = RANK_MASKS[4] | RANK_MASKS[5] | RANK_MASKS[6] | RANK_MASKS[7]
+            if(color == PieceColor.BLACK):
+                enemyHalf = RANK_MASKS[0] | RANK_MASKS[1] | RANK_MASKS[2] | RANK_MASKS[3]
+            
+            vision = 0
+            for i in range(0,nPieces):
+                piece = self.pieces[i]
+                if(piece.pieceColor == color):
+                    vision = vision | self.getVisionBitboard(piece.pieceType, piece.file, piece.rank, piece.moveCounter, color)
+            return countSquares(vision & enemyHalf)
+        
         space = 0
         registered = []
         for i in range(0,nPieces):
@@ -491,74 +768,284 @@ class ChessBoard:
                         
             
     
-    def isOccupied(self, file, rank):
-        for i in range(0,len(self.pieces)):
-            if(self.pieces[i].file == file and self.pieces[i].rank == rank):
-                return True
-            
+    def getSquareIndex(self, file, rank):
+        return SQUARE_INDEX.get(file + rank)
+    
+    def setSquare(self, file, rank, piece):
+        squareIndex = SQUARE_INDEX[file + rank]
+        if(not self.squares[squareIndex] is None):
+            self.clearSquare(file, rank)
+        
+        self.squares[squareIndex] = piece
+        squareBit = 1 << squareIndex
+        self.colorBitboards[piece.pieceColor.value] |= squareBit
+        self.typeBitboards[piece.pieceType.value] |= squareBit
+        self.placementHash ^= ZOBRIST_PIECES[piece.pieceColor.value][piece.pieceType.value][squareIndex]
+    
+    def clearSquare(self, file, rank):
+        squareIndex = SQUARE_INDEX[file + rank]
+        piece = self.squares[squareIndex]
+        if(not piece is None):
+            self.squares[squareIndex] = None
+            squareBit = ~(1 << squareIndex)
+            self.colorBitboards[piece.pieceColor.value] &= squareBit
+            self.typeBitboards[piece.pieceType.value] &= squareBit
+            self.placementHash ^= ZOBRIST_PIECES[piece.pieceColor.value][piece.pieceType.value][squareIndex]
+    
+    def getKingSquare(self, pieceColor):
+        kings = self.typeBitboards["K"] & self.colorBitboards[pieceColor.value]
+        if(kings == 0):
+            return -1
+        return getLowestSquare(kings)
+    
+    def isSquareAttacked(self, squareIndex, attackerColor, occupancy = None):
+        '''
+        Tells if a square is attacked by any piece of attackerColor. Sliders are 
+        blocked by occupancy, the pieces on the board by default.
+        '''
+        attackers = self.colorBitboards[attackerColor.value]
+        if(occupancy is None):
+            occupancy = self.colorBitboards[0] | self.colorBitboards[1]
+        types = self.typeBitboards
+        
+        if(PAWN_ATTACKS[1 - attackerColor.value][squareIndex] & types[""] & attackers):
+            return True
+        if(KNIGHT_ATTACKS[squareIndex] & types["N"] & attackers):
+            return True
+        if(KING_ATTACKS[squareIndex] & types["K"] & attackers):
+            return True
+        if(getBishopAttacks(squareIndex, occupancy) & (types["B"] | types["Q"]) & attackers):
+            return True
+        if(getRookAttacks(squareIndex, occupancy) & (types["R"] | types["Q"]) & attackers):
+            return True
         return False
     
+    def getPlacementKey(self):
+        '''
+        Identifies the piece placement, trial moves that are undone give back the same key
+        '''
+        types = self.typeBitboards
+        return (self.colorBitboards[0], self.colorBitboards[1], types[""], types["N"], types["B"], types["R"], types["Q"], types["K"])
+    
+    def hasCastlingRight(self, kingSquare, rookSquare, pieceColor):
+        '''
+        Tells if the king and a rook of pieceColor are on their squares and have not
+        moved yet
+        '''
+        king = self.squares[kingSquare]
+        rook = self.squares[rookSquare]
+        if(king is None or rook is None or king.pieceType != PieceType.KING or rook.pieceType != PieceType.ROOK):
+            return False
+        return king.pieceColor == pieceColor and rook.pieceColor == pieceColor and king.moveCounter == 0 and rook.moveCounter == 0
+    
+    def getCastlingHash(self):
+        '''
+        Zobrist part of the castling rights
+        '''
+        castlingHash = 0
+        for right, kingSquare, rookSquare in CASTLING_RIGHTS:
+            if(self.hasCastlingRight(kingSquare, rookSquare, PieceColor.WHITE if right.isupper() else PieceColor.BLACK)):
+                castlingHash ^= ZOBRIST_UNMOVED[rookSquare]
+        return castlingHash
+    
+    def getZobristKey(self, sideToMove = None):
+        '''
+        Zobrist key of the position: placement, castling rights, en passant square
+        and side to move (by default the side whose turn it is)
+        '''
+        if(sideToMove is None):
+            sideToMove = PieceColor(self.moveNumber % 2)
+        key = self.placementHash ^ self.getCastlingHash() ^ ZOBRIST_SIDE[sideToMove.value]
+        if(self.enPassantSquare >= 0):
+            key ^= ZOBRIST_EN_PASSANT[self.enPassantSquare]
+        return key
+    
+    def getAttackedSquares(self, attackerColor, occupancy):
+        '''
+        Every square attacked by attackerColor, with sliders blocked by occupancy
+        '''
+        attacked = 0
+        colorIndex = attackerColor.value
+        attackers = self.colorBitboards[colorIndex]
+        for pieceLetter in self.typeBitboards:
+            for squareIndex in getSquareIndices(self.typeBitboards[pieceLetter] & attackers):
+                attacked = attacked | getPieceAttacks(pieceLetter, colorIndex, squareIndex, occupancy)
+        return attacked
+    
+    def getLegalityMasks(self, pieceColor):
+        '''
+        One pass over the position giving what the moves of pieceColor must respect:
+        
+        checkers: enemy pieces giving check
+        checkMask: squares a non king move must land on (the checker and the squares
+        between it and the king), empty in double check
+        pinRays: for each pinned piece, the squares it can still move to
+        kingDanger: squares attacked by the enemy once the king leaves its square,
+        filled on demand by getKingDanger
+        '''
+        colorIndex = pieceColor.value
+        placementKey = self.getPlacementKey()
+        cached = self.legalityMasks[colorIndex]
+        if(not cached is None and cached["placementKey"] == placementKey):
+            return cached
+        
+        ownPieces = self.colorBitboards[colorIndex]
+        enemyPieces = self.colorBitboards[1 - colorIndex]
+        occupancy = ownPieces | enemyPieces
+        types = self.typeBitboards
+        kingSquare = self.getKingSquare(pieceColor)
+        
+        masks = {"placementKey": placementKey, "kingSquare": kingSquare, "checkers": 0, "checkMask": FULL_BOARD, "pinRays": {}, "kingDanger": None}
+        self.legalityMasks[colorIndex] = masks
+        if(kingSquare < 0):
+            return masks
+        
+        enemyDiagonals = (types["B"] | types["Q"]) & enemyPieces
+        enemyLines = (types["R"] | types["Q"]) & enemyPieces
+        checkers = (PAWN_ATTACKS[colorIndex][kingSquare] & types[""] & enemyPieces) | (KNIGHT_ATTACKS[kingSquare] & types["N"] & enemyPieces)
+        checkers = checkers | (getBishopAttacks(kingSquare, occupancy) & enemyDiagonals) | (getRookAttacks(kingSquare, occupancy) & enemyLines)
+        masks["checkers"] = checkers
+        
+        checkerSquares = getSquareIndices(checkers)
+        if(len(checkerSquares) == 1):
+            masks["checkMask"] = checkers | BETWEEN[kingSquare][checkerSquares[0]]
+        elif(len(checkerSquares) > 1):
+            masks["checkMask"] = 0
+        
+        #A piece is pinned when it is the only piece between its king and an enemy slider
+        pinners = (getBishopAttacks(kingSquare, enemyPieces) & enemyDiagonals) | (getRookAttacks(kingSquare, enemyPieces) & enemyLines)
+        for pinnerSquare in getSquareIndices(pinners & ~checkers):
+            between = BETWEEN[kingSquare][pinnerSquare]
+            blockers = between & occupancy
+            if(blockers & ownPieces and (blockers & (blockers - 1)) == 0):
+                masks["pinRays"][getLowestSquare(blockers)] = between | (1 << pinnerSquare)
+        
+        return masks
+    
+    def getKingDanger(self, pieceColor):
+        masks = self.getLegalityMasks(pieceColor)
+        if(masks["kingDanger"] is None):
+            occupancy = self.colorBitboards[0] | self.colorBitboards[1]
+            masks["kingDanger"] = self.getAttackedSquares(PieceColor(1 - pieceColor.value), occupancy & ~(1 << masks["kingSquare"]))
+        return masks["kingDanger"]
+    
+    def isMoveLegal(self, piece, file, rank):
+        '''
+        Tells if moving a piece to a square of its vision leaves its king safe, using 
+        getLegalityMasks instead of trying the move. King moves of two files are 
+        castling, which needs the king out of check and its path not attacked.
+        '''
+        masks = self.getLegalityMasks(piece.pieceColor)
+        fromSquare = piece.getSquareIndex()
+        toSquare = SQUARE_INDEX[file + rank]
+        
+        if(piece.pieceType == PieceType.KING):
+            kingDanger = self.getKingDanger(piece.pieceColor)
+            if(abs(toSquare - fromSquare) == 2):
+                passedSquare = (fromSquare + toSquare)//2
+                return masks["checkers"] == 0 and (kingDanger & ((1 << passedSquare) | (1 << toSquare))) == 0
+            return (kingDanger >> toSquare) & 1 == 0
+        
+        #Taking en passant empties two squares, so the move is tried
+        if(piece.pieceType == PieceType.PAWN and toSquare == self.enPassantSquare):
+            return self.isEnPassantLegal(piece)
+        
+        if((masks["checkMask"] >> toSquare) & 1 == 0):
+            return False
+        
+        pinRay = masks["pinRays"].get(fromSquare)
+        return pinRay is None or (pinRay >> toSquare) & 1 == 1
+    
+    def getEnPassantBitboard(self, pieceColor):
+        '''
+        The en passant square as a bitboard if pawns of pieceColor can take there
+        (it is on the sixth rank of their side), 0 otherwise
+        '''
+        squareIndex = self.enPassantSquare
+        if(squareIndex < 0 or (squareIndex // 8 == 5) != (pieceColor == PieceColor.WHITE)):
+            return 0
+        return 1 << squareIndex
+    
+    def getEnPassantVictim(self, pieceColor):
+        '''
+        The pawn that pieceColor would take en passant
+        '''
+        if(pieceColor == PieceColor.WHITE):
+            return self.squares[self.enPassantSquare - 8]
+        return self.squares[self.enPassantSquare + 8]
+    
+    def isEnPassantLegal(self, piece):
+        '''
+        Tells if a pawn can take en passant without leaving its king in check
+        '''
+        victim = self.getEnPassantVictim(piece.pieceColor)
+        if(victim is None):
+            return False
+        file = FILE_NAMES[self.enPassantSquare % 8]
+        rank = RANK_NAMES[self.enPassantSquare // 8]
+        self.clearSquare(victim.file, victim.rank)
+        self.clearSquare(piece.file, piece.rank)
+        self.setSquare(file, rank, piece)
+        check = self.isKingAttacked(piece.pieceColor)
+        self.clearSquare(file, rank)
+        self.setSquare(piece.file, piece.rank, piece)
+        self.setSquare(victim.file, victim.rank, victim)
+        return not check
+    
+    def isKingAttacked(self, kingColor):
+        kingSquare = self.getKingSquare(kingColor)
+        if(kingSquare < 0):
+            return False
+        return self.isSquareAttacked(kingSquare, PieceColor(1 - kingColor.value))
+    
+    def isOccupied(self, file, rank):
+        return not self.getPieceAtPosition(file, rank) is None
+    
     def isOccupiedByEnemyPiece(self, file, rank, enemyColor):
-        for i in range(0,len(self.pieces)):
-            if(self.pieces[i].file == file and self.pieces[i].rank == rank and self.pieces[i].pieceColor == enemyColor):
-                return True
-        
-        return False
+        piece = self.getPieceAtPosition(file, rank)
+        return (not piece is None) and piece.pieceColor == enemyColor
     
     def getPieceAtPosition(self, file, rank):
-        for i in range(0,len(self.pieces)):
-            if(self.pieces[i].file == file and self.pieces[i].rank == rank):
-                return self.pieces[i]
-        
-        return None
-            
-    def isKingInCheckAfterMoving(self, piece, newPieceType, file, rank, pieceColor):
-        originalFile = piece.file
-        originalRank = piece.rank
-        originalType = piece.pieceType
+        squareIndex = self.getSquareIndex(file, rank)
+        if(squareIndex is None):
+            return None
         
-        indexRemoved = -1
+        return self.squares[squareIndex]
+    
+    def applyTrialMove(self, piece, newPieceType, file, rank, pieceColor):
+        '''
+        Provisionally moves a piece, taking out the enemy piece standing on the 
+        destination (kings are never taken). Returns the state needed by undoTrialMove.
+        '''
+        removedIndex = -1
         removedPiece = self.getPieceAtPosition(file, rank)
         if((not removedPiece is None) and removedPiece.pieceType != PieceType.KING and pieceColor != removedPiece.pieceColor):
-            indexRemoved = self.pieces.index(removedPiece)
-            self.pieces.remove(removedPiece)
+            removedIndex = self.pieces.index(removedPiece)
+            self.pieces.pop(removedIndex)
         
-        piece.file = file
-        piece.rank = rank 
-        piece.pieceType = newPieceType
+        trialState = [piece, piece.file, piece.rank, piece.pieceType, removedPiece, removedIndex]
         
-        king = -1
-        for i in range(0,len(self.pieces)):
-            if(self.pieces[i].pieceType == PieceType.KING and self.pieces[i].pieceColor == pieceColor):
-                king = self.pieces[i]
+        self.clearSquare(piece.file, piece.rank)
+        piece.setPosition(file, rank)
+        piece.pieceType = newPieceType
+        self.setSquare(file, rank, piece)
         
-        kingFile = king.file
-        kingRank = king.rank
-        check = False
-        for i in range(0,len(self.pieces)):
-            if(self.pieces[i].pieceColor != pieceColor):
-                visionFiles, visionRanks, takes = self.getPieceBoardVision(self.pieces[i].pieceType, self.pieces[i].file, self.pieces[i].rank, self.pieces[i].moveCounter, self.pieces[i].pieceColor)
-                checkFound = False
-                for j in range(0,len(visionFiles)):
-                    if(kingFile == visionFiles[j] and kingRank == visionRanks[j]):
-                        check = True
-                        checkFound = True
-                        break
-                    
-                if(checkFound):
-                    break
-                    
+        return trialState
+    
+    def undoTrialMove(self, trialState):
+        piece, originalFile, originalRank, originalType, removedPiece, removedIndex = trialState
         
-        piece.file = originalFile
-        piece.rank = originalRank
+        self.clearSquare(piece.file, piece.rank)
+        piece.setPosition(originalFile, originalRank)
         piece.pieceType = originalType
+        self.setSquare(originalFile, originalRank, piece)
         
-        if((not removedPiece is None) and removedPiece.pieceType != PieceType.KING and pieceColor != removedPiece.pieceColor):
-            self.pieces.insert(indexRemoved, removedPiece)
+        if(not removedPiece is None):
+            self.setSquare(removedPiece.file, removedPiece.rank, removedPiece)
         
-        return check
-                
-    
+        if(removedIndex >= 0):
+            self.pieces.insert(removedIndex, removedPiece)
+            
     def isEnemyKingInCheckAfterMoving(self, piece, newPieceType, file, rank, pieceColor):
         #First let's get the enemy king 
         enemyColor = PieceColor.BLACK
@@ -575,20 +1062,12 @@ class ChessBoard:
         kingRank = king.rank
         
         #Move the piece provisionally
-        originalFile = piece.file
-        originalRank = piece.rank
-        originalType = piece.pieceType
-        
-        removedPiece = self.getPieceAtPosition(file, rank)
-        indexRemoved = -1
-        if((not removedPiece is None) and removedPiece.pieceType != PieceType.KING and pieceColor != removedPiece.pieceColor):
-            indexRemoved = self.pieces.index(removedPiece)
-            self.pieces.remove(removedPiece)
+        trialState = self.applyTrialMove(piece, newPieceType, file, rank, pieceColor)
         
-        
-        piece.file = file
-        piece.rank = rank
-        piece.pieceType = newPieceType
+        if(self.visionBackend == "bitboard"):
+            check = self.isSquareAttacked(SQUARE_INDEX[kingFile + kingRank], pieceColor)
+            self.undoTrialMove(trialState)
+            return check
         
         #Get the board vision of files under this 
         #and see if the king is seen by any pieces
@@ -606,15 +1085,7 @@ class ChessBoard:
                 if(checkFound):
                     break
                     
-        
-        if((not removedPiece is None) and removedPiece.pieceType != PieceType.KING and pieceColor != removedPiece.pieceColor):
-            self.pieces.insert(indexRemoved, removedPiece)
-        
-        piece.file = originalFile
-        piece.rank = originalRank
-        piece.pieceType = originalType
-        
-        
+        self.undoTrialMove(trialState)
         
         return check
         
@@ -622,58 +1093,220 @@ class ChessBoard:
     
     
     def isEnemyKingCheckmatedAfterMove(self, piece, newPieceType, file, rank, pieceColor, checkGlobal):
-        check = self.isEnemyKingInCheckAfterMoving(piece, newPieceType, file, rank, pieceColor)
+        '''
+        Tells if a move gives check and if it is checkmate. The move is tried once, 
+        a bitboard attack test settles the check and only checking moves go through
+        hasLegalReply, whose answer is cached per position.
+        '''
+        enemyColor = PieceColor(1 - pieceColor.value)
+        #A double step lets the replies take en passant
+        enPassantSquare = self.enPassantSquare
+        self.enPassantSquare = -1
+        toSquare = SQUARE_INDEX[file + rank]
+        if(piece.pieceType == PieceType.PAWN and abs(toSquare - piece.getSquareIndex()) == 16 and self.squares[(toSquare + piece.getSquareIndex())//2] is None):
+            self.enPassantSquare = (toSquare + piece.getSquareIndex())//2
+        trialState = self.applyTrialMove(piece, newPieceType, file, rank, pieceColor)
+        
+        check = self.isKingAttacked(enemyColor)
         checkmated = False
         if(check):
-            checkmated = True
-            removedIndex = -1
-            removedPiece = self.getPieceAtPosition(file, rank)
-            if((not removedPiece is None) and removedPiece.pieceType != PieceType.KING and pieceColor != removedPiece.pieceColor):
-                removedIndex = self.pieces.index(removedPiece)
-                self.pieces.remove(removedPiece)
-            
-            originalFile = piece.file
-            originalRank = piece.rank
-            originalType = piece.pieceType
-            
-            piece.file = file
-            piece.rank = rank
-            piece.pieceType = newPieceType
-            
-            notCheckmated = False
-            for i in range(0,len(self.pieces)):
-                if(self.pieces[i].pieceColor != pieceColor):
-                    fileVision, rankVision, takesArray = self.getPieceBoardVision(self.pieces[i].pieceType, self.pieces[i].file, self.pieces[i].rank, self.pieces[i].moveCounter, self.pieces[i].pieceColor)
-                    for j in range(0,len(fileVision)):
-                        if(not self.isKingInCheckAfterMoving(self.pieces[i], self.pieces[i].pieceType, fileVision[j], rankVision[j], self.pieces[i].pieceColor)):
-                            checkmated = False
-                            notCheckmated = True
-                            break
-                    if(notCheckmated):
-                        break
-            
-            piece.file = originalFile
-            piece.rank = originalRank
-            piece.pieceType = originalType
-            
-            
-            if((not removedPiece is None) and removedPiece.pieceType != PieceType.KING and pieceColor != removedPiece.pieceColor):
-                self.pieces.insert(removedIndex, removedPiece)
+            positionKey = (self.placementHash, enemyColor.value, self.enPassantSquare)
+            checkmated = self.mateCache.get(positionKey)
+            if(checkmated is None):
+                checkmated = not self.hasLegalReply(enemyColor)
+                if(len(self.mateCache) >= self.mateCacheSize):
+                    self.mateCache.clear()
+                self.mateCache[positionKey] = checkmated
+        
+        self.undoTrialMove(trialState)
+        self.enPassantSquare = enPassantSquare
         
         return check, checkmated
+    
+    def getMoveAnnotation(self, piece, newPieceType, file, rank, pieceColor, checkGlobal):
+        '''
+        Check and checkmate marks of a move being generated, left out (False, False)
+        unless the board annotates its moves eagerly
+        '''
+        if(not self.annotateMoves):
+            return False, False
+        return self.isEnemyKingCheckmatedAfterMove(piece, newPieceType, file, rank, pieceColor, checkGlobal)
+    
+    def getCheckStatus(self, piece, move):
+        '''
+        Tells if a move of a piece gives check and if it is checkmate. A move generated
+        without its marks works it out the first time it is asked and remembers the
+        answer for the current placement of the pieces and en passant square.
+        '''
+        if(move.annotated):
+            return move.check, move.checkMate
+        
+        statusKey = (self.placementHash, self.enPassantSquare)
+        if(move.statusKey != statusKey):
+            #Castling gives check through the rook
+            if(move.reducedString == "O-O" or move.reducedString == "O-O-O"):
+                rook = self.getPieceAtPosition("h" if move.reducedString == "O-O" else "a", piece.rank)
+                rookFile = "f" if move.reducedString == "O-O" else "d"
+                move.check, move.checkMate = self.isEnemyKingCheckmatedAfterMove(rook, rook.pieceType, rookFile, rook.rank, piece.pieceColor, False)
+            else:
+                newPieceType = piece.pieceType
+                if(move.promotion != ""):
+                    newPieceType = PieceType(move.promotion)
+                file, rank = move.getPieceFinalPosition()
+                move.check, move.checkMate = self.isEnemyKingCheckmatedAfterMove(piece, newPieceType, file, rank, piece.pieceColor, False)
+            move.statusKey = statusKey
+        return move.check, move.checkMate
+    
+    def getAnnotatedMoveString(self, piece, move):
+        '''
+        The move string of a move of a piece with its check or checkmate mark
+        '''
+        if(move.annotated):
+            return move.moveString
+        check, checkmate = self.getCheckStatus(piece, move)
+        if(checkmate):
+            return move.moveString + "#"
+        if(check):
+            return move.moveString + "+"
+        return move.moveString
+    
+    def hasLegalReply(self, pieceColor):
+        '''
+        Tells if a side in check has any legal move, stopping at the first one found:
+        king escapes first, then captures of the checker and interpositions on the 
+        check ray (only the king can answer a double check).
+        '''
+        colorIndex = pieceColor.value
+        enemyColor = PieceColor(1 - colorIndex)
+        masks = self.getLegalityMasks(pieceColor)
+        kingSquare = masks["kingSquare"]
+        if(kingSquare < 0):
+            return False
+        
+        ownPieces = self.colorBitboards[colorIndex]
+        occupancy = self.colorBitboards[0] | self.colorBitboards[1]
+        occupancyWithoutKing = occupancy & ~(1 << kingSquare)
+        for squareIndex in getSquareIndices(KING_ATTACKS[kingSquare] & ~ownPieces):
+            if(not self.isSquareAttacked(squareIndex, enemyColor, occupancyWithoutKing)):
+                return True
+        
+        targets = masks["checkMask"]
+        if(targets == 0):
+            return False
+        
+        for squareIndex in getSquareIndices(ownPieces & ~(1 << kingSquare)):
+            piece = self.squares[squareIndex]
+            vision = self.getVisionBitboard(piece.pieceType, piece.file, piece.rank, piece.moveCounter, pieceColor)
+            replies = vision & targets
+            pinRay = masks["pinRays"].get(squareIndex)
+            if(not pinRay is None):
+                replies = replies & pinRay
+            if(replies):
+                return True
+            #Taking en passant answers a check given by the pawn that made the double step
+            if(piece.pieceType == PieceType.PAWN and vision & self.getEnPassantBitboard(pieceColor)):
+                if(self.isEnPassantLegal(piece)):
+                    return True
+        
+        return False
 
                     
     def addPiece(self, pieceType, pieceColor, file, rank):
+        if(self.isOccupied(file, rank)):
+            return
+        
         piece = ChessPiece(pieceType, pieceColor, file, rank)
-        if(not piece in self.pieces):
-            self.pieces.append(piece)
-    
+        self.pieces.append(piece)
+        self.setSquare(file, rank, piece)
+
     def getPieceBoardVision(self, pieceType, file, rank, pieceMoveCounter, pieceColor):
+        '''
+        Squares a piece can go to, as parallel lists of files and ranks plus a list 
+        telling which of them take an enemy piece.
+        '''
+        if(self.visionBackend == "bitboard"):
+            return self.getBitboardVision(pieceType, file, rank, pieceMoveCounter, pieceColor)
+        
+        return self.getMailboxVision(pieceType, file, rank, pieceMoveCounter, pieceColor)
+    
+    def getVisionBitboard(self, pieceType, file, rank, pieceMoveCounter, pieceColor):
+        '''
+        Same squares as getPieceBoardVision packed in a 64 bit integer
+        '''
+        squareIndex = SQUARE_INDEX[file + rank]
+        colorIndex = pieceColor.value
+        ownPieces = self.colorBitboards[colorIndex]
+        enemyPieces = self.colorBitboards[1 - colorIndex]
+        occupancy = ownPieces | enemyPieces
+        
+        if(pieceType == PieceType.PAWN):
+            captures = PAWN_ATTACKS[colorIndex][squareIndex] & (enemyPieces | self.getEnPassantBitboard(pieceColor))
+            return getPawnPushes(colorIndex, squareIndex, occupancy, pieceMoveCounter == 0) | captures
+        
+        vision = getPieceAttacks(pieceType.value, colorIndex, squareIndex, occupancy) & ~ownPieces
+        
+        if(pieceType == PieceType.KING and pieceMoveCounter == 0):
+            rook1 = self.getPieceAtPosition("h", rank)
+            rook2 = self.getPieceAtPosition("a", rank)
+            if(not rook1 is None and rook1.pieceType == PieceType.ROOK and rook1.pieceColor == pieceColor and rook1.moveCounter == 0 and not self.isOccupied("f", rank) and not self.isOccupied("g", rank)):
+                vision = vision | (1 << SQUARE_INDEX["g" + rank])
+            if(not rook2 is None and rook2.pieceType == PieceType.ROOK and rook2.pieceColor == pieceColor and rook2.moveCounter == 0 and not self.isOccupied("b", rank) and not self.isOccupied("c", rank) and not self.isOccupied("d", rank)):
+                vision = vision | (1 << SQUARE_INDEX["c" + rank])
+        
+        return vision
+    
+    def getTypedVisionBitboards(self, pieceType, file, rank, pieceMoveCounter, pieceColor):
+        '''
+        The squares a piece relates to, split by edge type (see EDGE_TYPES): moves to
+        empty squares, captures, defended own pieces and x-rays (squares a slider 
+        would see if the first piece on each ray were not there). move | capture is
+        getVisionBitboard.
+        '''
+        squareIndex = SQUARE_INDEX[file + rank]
+        colorIndex = pieceColor.value
+        ownPieces = self.colorBitboards[colorIndex]
+        enemyPieces = self.colorBitboards[1 - colorIndex]
+        occupancy = ownPieces | enemyPieces
+        
+        if(pieceType == PieceType.PAWN):
+            attacks = PAWN_ATTACKS[colorIndex][squareIndex]
+            captures = attacks & (enemyPieces | self.getEnPassantBitboard(pieceColor))
+            return [getPawnPushes(colorIndex, squareIndex, occupancy, pieceMoveCounter == 0), captures, attacks & ownPieces, 0]
+        
+        pieceLetter = pieceType.value
+        attacks = getPieceAttacks(pieceLetter, colorIndex, squareIndex, occupancy)
+        xray = 0
+        if(pieceLetter == "B" or pieceLetter == "R" or pieceLetter == "Q"):
+            xray = getPieceAttacks(pieceLetter, colorIndex, squareIndex, occupancy & ~attacks) & ~attacks
+        
+        move = attacks & ~occupancy
+        if(pieceType == PieceType.KING and pieceMoveCounter == 0):
+            move = move | (self.getVisionBitboard(pieceType, file, rank, pieceMoveCounter, pieceColor) & ~attacks)
+        
+        return [move, attacks & enemyPieces, attacks & ownPieces, xray]
+    
+    def getBitboardVision(self, pieceType, file, rank, pieceMoveCounter, pieceColor):
+        vision = self.getVisionBitboard(pieceType, file, rank, pieceMoveCounter, pieceColor)
+        enemyPieces = self.colorBitboards[1 - pieceColor.value]
+        if(pieceType == PieceType.PAWN):
+            enemyPieces = enemyPieces | self.getEnPassantBitboard(pieceColor)
+        
         visionFiles = []
         visionRanks = []
         takes = []
+        for squareIndex in getSquareIndices(vision):
+            visionFiles.append(FILE_NAMES[squareIndex % 8])
+            visionRanks.append(RANK_NAMES[squareIndex // 8])
+            takes.append((enemyPieces >> squareIndex) & 1 == 1)
         
-        translator = ChessCoordinateTranslator()
+        return visionFiles, visionRanks, takes
+    
+    def getMailboxVision(self, pieceType, file, rank, pieceMoveCounter, pieceColor):
+        visionFiles = []
+        visionRanks = []
+        takes = []
+        
+        translator = COORDINATE_TRANSLATOR
         
         matrixCoords = translator.getMatrixCoordinates(file, rank)
         enemyColor = PieceColor.BLACK
@@ -699,7 +1332,8 @@ class ChessBoard:
   
                 if(index1 >= 0 and pieceMoveCounter == 0):
                     translated = translator.getChessNotationCoordinates(index1, index2)
-                    if(not self.isOccupied(translated[0], translated[1])):
+                    passedSquare = translator.getChessNotationCoordinates(index1+1, index2)
+                    if(not self.isOccupied(translated[0], translated[1]) and not self.isOccupied(passedSquare[0], passedSquare[1])):
                         visionFiles.append(translated[0])
                         visionRanks.append(translated[1])
                         takes.append(False)
@@ -725,24 +1359,14 @@ class ChessBoard:
                         takes.append(True)
             
                 #En passant
-                if(matrixCoords[0] == 4):
-                    index1 = matrixCoords[0]
-                    index2 = matrixCoords[1]+1
-                    candidate1 = self.getPieceAtPosition(index1, index2)
-                    if(candidate1 != None and candidate1.pieceColor == enemyColor and candidate1.moveCounter == 1):
-                        translated = translator.getChessNotationCoordinates(index1-1, index2)
-                        visionFiles.append(translated[0])
-                        visionRanks.append(translated[1])
-                        takes.append(True)
-                
-                    index1 = matrixCoords[0]
-                    index2 = matrixCoords[1]-1
-                    candidate2 = self.getPieceAtPosition(index1, index2)
-                    if(candidate2 != None and candidate2.pieceColor == enemyColor and candidate2.moveCounter == 1):
-                        translated = translator.getChessNotationCoordinates(index1-1, index2)
-                        visionFiles.append(translated[0])
-                        visionRanks.append(translated[1])
-                        takes.append(True)
+                if(matrixCoords[0] == 3 and self.getEnPassantBitboard(pieceColor)):
+                    for index2 in [matrixCoords[1] - 1, matrixCoords[1] + 1]:
+                        if(index2 >= 0 and index2 <= 7):
+                            translated = translator.getChessNotationCoordinates(2, index2)
+                            if(SQUARE_INDEX[translated[0] + translated[1]] == self.enPassantSquare):
+                                visionFiles.append(translated[0])
+                                visionRanks.append(translated[1])
+                                takes.append(True)
             
             elif(pieceColor == PieceColor.BLACK):
                 #Move forward
@@ -762,7 +1386,8 @@ class ChessBoard:
   
                 if(index1 <=7 and pieceMoveCounter == 0):
                     translated = translator.getChessNotationCoordinates(index1, index2)
-                    if(not self.isOccupied(translated[0], translated[1])):
+                    passedSquare = translator.getChessNotationCoordinates(index1-1, index2)
+                    if(not self.isOccupied(translated[0], translated[1]) and not self.isOccupied(passedSquare[0], passedSquare[1])):
                         visionFiles.append(translated[0])
                         visionRanks.append(translated[1])
                         takes.append(False)
@@ -788,24 +1413,14 @@ class ChessBoard:
                         takes.append(True)
             
                 #En passant
-                if(matrixCoords[0] == 3):
-                    index1 = matrixCoords[0]
-                    index2 = matrixCoords[1]+1
-                    candidate1 = self.getPieceAtPosition(index1, index2)
-                    if(candidate1 != None and candidate1.pieceColor == enemyColor and candidate1.moveCounter == 1):
-                        translated = translator.getChessNotationCoordinates(index1-1, index2)
-                        visionFiles.append(translated[0])
-                        visionRanks.append(translated[1])
-                        takes.append(True)
-                
-                    index1 = matrixCoords[0]
-                    index2 = matrixCoords[1]-1
-                    candidate2 = self.getPieceAtPosition(index1, index2)
-                    if(candidate2 != None and candidate2.pieceColor == enemyColor and candidate2.moveCounter == 1):
-                        translated = translator.getChessNotationCoordinates(index1-1, index2)
-                        visionFiles.append(translated[0])
-                        visionRanks.append(translated[1])
-                        takes.append(True)
+                if(matrixCoords[0] == 4 and self.getEnPassantBitboard(pieceColor)):
+                    for index2 in [matrixCoords[1] - 1, matrixCoords[1] + 1]:
+                        if(index2 >= 0 and index2 <= 7):
+                            translated = translator.getChessNotationCoordinates(5, index2)
+                            if(SQUARE_INDEX[translated[0] + translated[1]] == self.enPassantSquare):
+                                visionFiles.append(translated[0])
+                                visionRanks.append(translated[1])
+                                takes.append(True)
             
                     
         elif(pieceType == PieceType.BISHOP):
@@ -1186,36 +1801,59 @@ class ChessBoard:
             
             rook1 = self.getPieceAtPosition("h", rank)
             rook2 = self.getPieceAtPosition("a", rank)
-            if(not rook1 is None and rook1.pieceColor == pieceColor and rook1.moveCounter == 0 and pieceMoveCounter == 0 and not self.isOccupied("f", rank) and not self.isOccupied("g", rank)):
+            if(not rook1 is None and rook1.pieceType == PieceType.ROOK and rook1.pieceColor == pieceColor and rook1.moveCounter == 0 and pieceMoveCounter == 0 and not self.isOccupied("f", rank) and not self.isOccupied("g", rank)):
                 visionFiles.append("g")
                 visionRanks.append(rank)
                 takes.append(False)
             
             
-            if(not rook2 is None and rook2.pieceColor == pieceColor and rook2.moveCounter == 0 and pieceMoveCounter == 0 and not self.isOccupied("b", rank) and not self.isOccupied("c", rank) and not self.isOccupied("d", rank)):
+            if(not rook2 is None and rook2.pieceType == PieceType.ROOK and rook2.pieceColor == pieceColor and rook2.moveCounter == 0 and pieceMoveCounter == 0 and not self.isOccupied("b", rank) and not self.isOccupied("c", rank) and not self.isOccupied("d", rank)):
                 visionFiles.append("c")
                 visionRanks.append(rank)
                 takes.append(False)
         return visionFiles, visionRanks, takes
                 
-    def isDestinationSquareShared(self, refPiece, pieceType, pieceColor, file, rank):
-        for i in range(0,len(self.pieces)):
-            piece = self.pieces[i]
-            if(refPiece != piece and piece.pieceColor == pieceColor and piece.pieceType == pieceType):
-                moves = piece.getPieceMoves()
-                for j in range(0,len(moves)):
-                    move = moves[j]
-                    destination = move.getPieceFinalPosition()
-                    if(destination[0] == file and destination[1] == rank):
-                        return True, piece.file, piece.rank, move
-        return False, "", "", None
+    def getPiecesSharingDestination(self, refPiece, file, rank):
+        '''
+        (piece, move) of every other piece of the type and colour of refPiece that
+        already has a move to the square
+        '''
+        sharingPieces = []
+        for piece in self.pieces:
+            if(refPiece is not piece and piece.pieceColor == refPiece.pieceColor and piece.pieceType == refPiece.pieceType):
+                move = piece.movesByTarget.get((file, rank, ""))
+                if(not move is None):
+                    sharingPieces.append((piece, move))
+        return sharingPieces
+    
+    def getDisambiguation(self, piece, otherPieces):
+        '''
+        File and rank ("" when not needed) telling a move of piece apart from the moves
+        of otherPieces to the same square: the file if none of them shares it, else the
+        rank if none of them shares it, else both
+        '''
+        if(len(otherPieces) == 0):
+            return "", ""
+        sameFile = False
+        sameRank = False
+        for otherPiece in otherPieces:
+            sameFile = sameFile or otherPiece.file == piece.file
+            sameRank = sameRank or otherPiece.rank == piece.rank
+        if(not sameFile):
+            return piece.file, ""
+        if(not sameRank):
+            return "", piece.rank
+        return piece.file, piece.rank
     
     
     def removePiece(self, file, rank, pieceColor):
-        for i in range(0,len(self.pieces)):
-            if(self.pieces[i].pieceColor == pieceColor and self.pieces[i].file == file and self.pieces[i].rank == rank):
-                self.pieces.pop(i)
-                break
+        piece = self.getPieceAtPosition(file, rank)
+        if((not piece is None) and piece.pieceColor == pieceColor):
+            self.clearSquare(file, rank)
+            self.pieces.remove(piece)
+            return piece
+        
+        return None
                 
     
     def initializeBoard(self):
@@ -1244,80 +1882,705 @@ class ChessBoard:
         self.addPiece(PieceType.KING, PieceColor.WHITE, "e", "1")
         
         self.updateMoves(False, False)
+    
+    @classmethod
+    def fromFEN(cls, fen, **boardOptions):
+        '''
+        New board (boardOptions go to the constructor) holding the position of a FEN
+        string, None if the string can not be read
+        '''
+        board = cls(**boardOptions)
+        if(board.loadFEN(fen) == -1):
+            return None
+        return board
+    
+    def loadFEN(self, fen):
+        '''
+        Sets up the position of a FEN string on an empty board: placement, side to
+        move, castling rights, en passant square and both clocks (which can be left
+        out). Castling rights are given to the kings and rooks as a move counter of
+        0, which is what castling looks at; the other pieces and the pawns off their
+        start rank get a counter of 1. A right without its king and rook is refused.
+        '''
+        fields = fen.split()
+        if(len(fields) == 4):
+            fields = fields + ["0", "1"]
+        if(len(fields) != 6):
+            print("A FEN string has 6 fields: " + fen)
+            return -1
+        placement, sideToMove, castlingRights, enPassant, halfmoveClock, fullmoveNumber = fields
+        
+        rows = placement.split("/")
+        if(len(rows) != 8 or not sideToMove in ["w", "b"] or not re.match(r'^(-|[KQkq]+)$', castlingRights)):
+            print("Invalid FEN string: " + fen)
+            return -1
+        if(not (enPassant == "-" or enPassant in SQUARE_INDEX) or not halfmoveClock.isdigit() or not fullmoveNumber.isdigit()):
+            print("Invalid FEN string: " + fen)
+            return -1
+        
+        for i in range(0,8):
+            rank = RANK_NAMES[7 - i]
+            fileIndex = 0
+            for symbol in rows[i]:
+                if(symbol.isdigit()):
+                    fileIndex = fileIndex + int(symbol)
+                    continue
+                if(fileIndex > 7 or not symbol.upper() in "PRNBQK"):
+                    print("Invalid FEN placement: " + placement)
+                    return -1
+                pieceColor = PieceColor.WHITE if symbol.isupper() else PieceColor.BLACK
+                pieceType = PieceType("" if symbol.upper() == "P" else symbol.upper())
+                self.addPiece(pieceType, pieceColor, FILE_NAMES[fileIndex], rank)
+                fileIndex = fileIndex + 1
+            if(fileIndex != 8):
+                print("Invalid FEN placement: " + placement)
+                return -1
+        
+        for color in [PieceColor.WHITE, PieceColor.BLACK]:
+            if(countSquares(self.typeBitboards["K"] & self.colorBitboards[color.value]) != 1):
+                print("The position needs one king of each color: " + fen)
+                return -1
         
+        #Squares keeping their castling piece unmoved for each right
+        castlingSquares = {"K": ["e1", "h1"], "Q": ["e1", "a1"], "k": ["e8", "h8"], "q": ["e8", "a8"]}
+        unmovedSquares = set()
+        for right in castlingRights.replace("-", ""):
+            unmovedSquares.update(castlingSquares[right])
+        for piece in self.pieces:
+            if(piece.pieceType == PieceType.PAWN):
+                startRank = "2" if piece.pieceColor == PieceColor.WHITE else "7"
+                piece.moveCounter = 0 if piece.rank == startRank else 1
+            elif((piece.pieceType == PieceType.KING or piece.pieceType == PieceType.ROOK) and (piece.file + piece.rank) in unmovedSquares):
+                piece.moveCounter = 0
+            else:
+                piece.moveCounter = 1
+        #A right needs its king and rook on their squares, toFEN would drop it otherwise
+        for right, kingSquare, rookSquare in CASTLING_RIGHTS:
+            if(right in castlingRights and not self.hasCastlingRight(kingSquare, rookSquare, PieceColor.WHITE if right.isupper() else PieceColor.BLACK)):
+                print("Castling right " + right + " without its king and rook: " + fen)
+                return -1
+        
+        if(enPassant != "-"):
+            self.enPassantSquare = SQUARE_INDEX[enPassant]
+            if(not enPassant[1] in ["3", "6"] or not self.squares[self.enPassantSquare] is None):
+                print("Invalid en passant square: " + enPassant)
+                return -1
+        self.halfmoveClock = int(halfmoveClock)
+        self.moveNumber = 2*(max(int(fullmoveNumber), 1) - 1) + (0 if sideToMove == "w" else 1)
+        
+        colorToMove = PieceColor(self.moveNumber % 2)
+        check = self.isKingAttacked(colorToMove)
+        checkmate = check and not self.hasLegalReply(colorToMove)
+        self.updateMoves(False, False)
+        if(check):
+            self.updateSideMoves(colorToMove, check, checkmate)
+        #The other side's moves are those of a position where it does not play
+        self.needsFullUpdate[1 - colorToMove.value] = True
+        if(checkmate):
+            self.gameEnded = True
+            self.winner = PieceColor(1 - colorToMove.value)
+    
+    def getCastlingRights(self):
+        '''
+        Castling rights in FEN notation ("KQkq", "-" when there are none)
+        '''
+        castlingRights = ""
+        for right, kingSquare, rookSquare in CASTLING_RIGHTS:
+            if(self.hasCastlingRight(kingSquare, rookSquare, PieceColor.WHITE if right.isupper() else PieceColor.BLACK)):
+                castlingRights = castlingRights + right
+        if(castlingRights == ""):
+            return "-"
+        return castlingRights
+    
+    def toFEN(self):
+        '''
+        FEN string of the current position
+        '''
+        rows = []
+        for rankIndex in range(7, -1, -1):
+            row = ""
+            emptySquares = 0
+            for fileIndex in range(0,8):
+                piece = self.squares[8*rankIndex + fileIndex]
+                if(piece is None):
+                    emptySquares = emptySquares + 1
+                    continue
+                if(emptySquares > 0):
+                    row = row + str(emptySquares)
+                    emptySquares = 0
+                symbol = "P" if piece.pieceType == PieceType.PAWN else piece.pieceType.value
+                row = row + (symbol if piece.pieceColor == PieceColor.WHITE else symbol.lower())
+            if(emptySquares > 0):
+                row = row + str(emptySquares)
+            rows.append(row)
+        
+        sideToMove = "w" if self.moveNumber % 2 == 0 else "b"
+        enPassant = "-"
+        if(self.enPassantSquare >= 0):
+            enPassant = FILE_NAMES[self.enPassantSquare % 8] + RANK_NAMES[self.enPassantSquare // 8]
+        return " ".join(["/".join(rows), sideToMove, self.getCastlingRights(), enPassant, str(self.halfmoveClock), str(self.moveNumber//2 + 1)])
+        
+    def enableProfiling(self, methods = PROFILED_METHODS):
+        '''
+        Starts counting the calls and time of the given methods of this board, the
+        report of the returned BoardProfiler has them per ply and per game
+        '''
+        if(self.profiler is None):
+            self.profiler = BoardProfiler(self, methods)
+        self.profiler.enable()
+        return self.profiler
+    
+    def disableProfiling(self):
+        if(not self.profiler is None):
+            self.profiler.disable()
+    
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if(not self.profiler is None):
+            for name in self.profiler.getWrappedMethods():
+                state.pop(name, None)
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if(not self.profiler is None and self.profiler.enabled):
+            self.profiler.installWrappers()
+    
+    def getProfile(self):
+        '''
+        Report of the profiler as a dict (see BoardProfiler.getReport), None if 
+        profiling was never enabled
+        '''
+        if(self.profiler is None):
+            return None
+        return self.profiler.getReport()
+    
+    def computePieceMoves(self, piece, check, checkmate):
+        #Every move list is computed through here, so it can be profiled per board
+        piece.computePieceMoves(self, check, checkmate)
+    
     def updateMoves(self, check, checkMate):
         for i in range(0,len(self.pieces)):
             self.pieces[i].resetPieceMoves()
             
             
         for i in range(0,len(self.pieces)):
-            self.pieces[i].computePieceMoves(self, check,checkMate)
+            self.computePieceMoves(self.pieces[i], check, checkMate)
+        
+        for colorIndex in [0, 1]:
+            self.moveIndex[colorIndex] = None
+            self.pendingMoveUpdates[colorIndex] = False
+            self.dirtySquares[colorIndex] = 0
+            self.dirtyTypes[colorIndex] = set()
+            self.needsFullUpdate[colorIndex] = check or checkMate or self.isKingAttacked(PieceColor(colorIndex))
+    
+    def getReachBitboard(self, piece, occupancy):
+        '''
+        Every square whose content can change the moves of a piece: its attacks up to
+        the first blocker and, for pawns, the squares in front.
+        '''
+        squareIndex = piece.getSquareIndex()
+        colorIndex = piece.pieceColor.value
+        if(piece.pieceType == PieceType.PAWN):
+            reach = PAWN_ATTACKS[colorIndex][squareIndex] | PAWN_PUSHES[colorIndex][squareIndex]
+            if(PAWN_PUSHES[colorIndex][squareIndex]):
+                reach = reach | PAWN_PUSHES[colorIndex][getLowestSquare(PAWN_PUSHES[colorIndex][squareIndex])]
+            return reach
+        
+        return getPieceAttacks(piece.pieceType.value, colorIndex, squareIndex, occupancy)
+    
+    def getPiecesAffectedByChanges(self, pieceColor):
+        '''
+        Pieces of one side whose moves can differ after the squares in dirtySquares 
+        changed: pieces standing on or reaching those squares, pieces on the lines
+        joining either king to them (pins and discovered checks), pieces holding
+        checking moves, the king, the rooks that can still castle, and every piece 
+        sharing a type with those (move disambiguation depends on the whole group, 
+        for pawns the group is their file).
+        '''
+        colorIndex = pieceColor.value
+        dirty = self.dirtySquares[colorIndex]
+        occupancy = self.colorBitboards[0] | self.colorBitboards[1]
+        kingSquares = [self.getKingSquare(pieceColor), self.getKingSquare(PieceColor(1 - colorIndex))]
+        
+        lines = 0
+        for squareIndex in getSquareIndices(dirty):
+            for kingSquare in kingSquares:
+                if(kingSquare >= 0 and DIRECTION_TABLE[kingSquare][squareIndex] >= 0):
+                    lines = lines | RAYS[DIRECTION_TABLE[kingSquare][squareIndex]][kingSquare]
+        
+        affectedTypes = set(self.dirtyTypes[colorIndex])
+        affectedPawnFiles = set()
+        affected = set()
+        for i in range(0,len(self.pieces)):
+            piece = self.pieces[i]
+            if(piece.pieceColor != pieceColor):
+                continue
+            
+            squareBit = 1 << piece.getSquareIndex()
+            isAffected = piece.pieceType == PieceType.KING or (piece.pieceType == PieceType.ROOK and piece.moveCounter == 0)
+            isAffected = isAffected or (squareBit & (dirty | lines)) != 0
+            isAffected = isAffected or (self.getReachBitboard(piece, occupancy) & (dirty | lines)) != 0
+            if(not isAffected):
+                for move in piece.pieceMoves:
+                    if(move.annotated and (move.check or move.checkMate)):
+                        isAffected = True
+                        break
+            
+            if(isAffected):
+                affected.add(id(piece))
+                affectedTypes.add(piece.pieceType)
+                if(piece.pieceType == PieceType.PAWN):
+                    affectedPawnFiles.add(piece.file)
         
+        affectedPieces = []
+        for i in range(0,len(self.pieces)):
+            piece = self.pieces[i]
+            if(piece.pieceColor != pieceColor):
+                continue
+            
+            #Pawns only share destinations with pawns on their own file
+            if(piece.pieceType == PieceType.PAWN):
+                inGroup = piece.file in affectedPawnFiles
+            else:
+                inGroup = piece.pieceType in affectedTypes
+            if(id(piece) in affected or inGroup):
+                affectedPieces.append(piece)
         
+        return affectedPieces
     
-    def makeMove(self, moveString):
+    def updateSideMoves(self, pieceColor, check, checkmate):
+        '''
+        Recomputes the moves of one side after a move, following moveUpdateMode
+        '''
+        colorIndex = pieceColor.value
+        self.pendingMoveUpdates[colorIndex] = False
+        sidePieces = []
+        for i in range(0,len(self.pieces)):
+            if(self.pieces[i].pieceColor == pieceColor):
+                sidePieces.append(self.pieces[i])
+        
+        inCheck = check or checkmate or self.isKingAttacked(pieceColor)
+        
+        #The move lists only depend on the position and the check flags of the move played
+        useCache = (not self.transpositionCache is None) and self.moveUpdateMode != "verify"
+        if(useCache):
+            cacheKey = (self.getZobristKey(pieceColor), check, checkmate, self.annotateMoves)
+            cachedMoves = self.transpositionCache.get("moves", cacheKey)
+            if(not cachedMoves is None):
+                self.moveIndex[colorIndex] = None
+                for squareIndex, moveStrings in cachedMoves:
+                    self.squares[squareIndex].setPieceMoves([ChessMove(moveString, self.annotateMoves) for moveString in moveStrings])
+                self.dirtySquares[colorIndex] = 0
+                self.dirtyTypes[colorIndex] = set()
+                self.needsFullUpdate[colorIndex] = inCheck
+                return
+        
+        kingMoved = (self.dirtySquares[colorIndex] & self.typeBitboards["K"]) != 0
+        fullUpdate = self.moveUpdateMode == "full" or inCheck or kingMoved or self.needsFullUpdate[colorIndex]
+        
+        if(fullUpdate):
+            piecesToUpdate = sidePieces
+        else:
+            piecesToUpdate = self.getPiecesAffectedByChanges(pieceColor)
+        
+        for i in range(0,len(piecesToUpdate)):
+            piecesToUpdate[i].resetPieceMoves()
+        for i in range(0,len(piecesToUpdate)):
+            self.computePieceMoves(piecesToUpdate[i], check, checkmate)
+        
+        if(self.moveUpdateMode == "verify" and not fullUpdate):
+            incrementalMoves = []
+            for i in range(0,len(sidePieces)):
+                incrementalMoves.append([move.moveString for move in sidePieces[i].pieceMoves])
+            
+            for i in range(0,len(sidePieces)):
+                sidePieces[i].resetPieceMoves()
+            for i in range(0,len(sidePieces)):
+                self.computePieceMoves(sidePieces[i], check, checkmate)
+            
+            for i in range(0,len(sidePieces)):
+                fullMoves = [move.moveString for move in sidePieces[i].pieceMoves]
+                if(fullMoves != incrementalMoves[i]):
+                    self.incrementalMismatches.append({"moveNumber": self.moveNumber, "piece": sidePieces[i].pieceType.value + sidePieces[i].file + sidePieces[i].rank,
+                                                       "incremental": incrementalMoves[i], "full": fullMoves})
+        
+        if(useCache):
+            cachedMoves = tuple((piece.getSquareIndex(), tuple(move.moveString for move in piece.pieceMoves)) for piece in sidePieces)
+            self.transpositionCache.put("moves", cacheKey, cachedMoves)
+        
+        self.dirtySquares[colorIndex] = 0
+        self.dirtyTypes[colorIndex] = set()
+        self.needsFullUpdate[colorIndex] = inCheck
+        self.moveIndex[colorIndex] = None
+    
+    def ensureSideMoves(self, pieceColor):
+        '''
+        Computes the moves of a side whose update pushMoveUCI left pending, in the
+        current position and with its check state read from the board. Moves of the
+        side that is not to move are never reused by the next incremental update.
+        '''
+        colorIndex = pieceColor.value
+        if(self.pendingMoveUpdates[colorIndex]):
+            check = self.isKingAttacked(pieceColor)
+            checkmate = check and not self.hasLegalReply(pieceColor)
+            isSideToMove = colorIndex == self.moveNumber % 2
+            if(not isSideToMove):
+                self.needsFullUpdate[colorIndex] = True
+            self.updateSideMoves(pieceColor, check, checkmate)
+            if(not isSideToMove):
+                self.needsFullUpdate[colorIndex] = True
+        
+    
+    def getMoveIndex(self, pieceColor):
+        '''
+        Moves of one side by canonical SAN (see getCanonicalSAN), as [move, pieces]
+        entries: castling moves the king and the rook. Built when first needed 
+        after the move lists change.
+        '''
+        self.ensureSideMoves(pieceColor)
+        index = self.moveIndex[pieceColor.value]
+        if(index is None):
+            index = {}
+            for piece in self.pieces:
+                if(piece.pieceColor != pieceColor):
+                    continue
+                for move in piece.pieceMoves:
+                    key = getCanonicalSAN(move.moveString)
+                    entry = index.get(key)
+                    if(entry is None):
+                        index[key] = [move, [piece]]
+                    else:
+                        entry[1].append(piece)
+            self.moveIndex[pieceColor.value] = index
+        return index
+    
+    def findMove(self, moveString):
+        '''
+        Resolves a SAN move of the side to move, whatever its check marks and 
+        annotations (!?, +, #) or an over specified origin. Returns the move of the
+        board and the pieces it moves, or None and an empty list.
+        '''
+        index = self.getMoveIndex(PieceColor(self.moveNumber % 2))
+        key = getCanonicalSAN(moveString)
+        entry = index.get(key)
+        if(not entry is None):
+            return entry[0], entry[1]
+        
+        parsedMove = parseSAN(key)
+        if(parsedMove is None):
+            return None, []
+        pieceLetter, fromFile, fromRank, destination, promotion = parsedMove
+        matches = []
+        for candidateKey in index:
+            candidate = parseSAN(candidateKey)
+            if(candidate is None or candidate[0] != pieceLetter or candidate[3] != destination or candidate[4] != promotion):
+                continue
+            move, pieces = index[candidateKey]
+            if((fromFile == "" or pieces[0].file == fromFile) and (fromRank == "" or pieces[0].rank == fromRank)):
+                matches.append(index[candidateKey])
+        
+        if(len(matches) != 1):
+            return None, []
+        return matches[0][0], matches[0][1]
+    
+    def pushMove(self, moveString):
+        '''
+        Plays a move and stacks what is needed to take it back with popMove. Returns
+        False (leaving the board untouched) when the move is not available.
+        '''
+        boardMove, movingPieces = self.findMove(moveString)
+        if(boardMove is None):
+            return False
+        #A copy, the move lists can still rewrite their own moves
+        move = ChessMove(boardMove.moveString, boardMove.annotated)
+        self.playMove(move, movingPieces, False)
+        return True
+    
+    def findMoveUCI(self, uciMove):
+        '''
+        Checks a UCI move of the side to move directly against the board (the piece
+        on the origin, its vision and the legality masks), without the move lists.
+        Returns the pieces it moves (king and rook when castling), the destination
+        and the promotion letter, or None when the move is not legal.
+        '''
+        parsedMove = parseUCI(uciMove)
+        if(parsedMove is None or self.gameEnded):
+            return None
+        origin, destination, promotion = parsedMove
+        piece = self.squares[SQUARE_INDEX[origin]]
+        if(piece is None or piece.pieceColor != PieceColor(self.moveNumber % 2)):
+            return None
+        
+        file = destination[0]
+        rank = destination[1]
+        fileVision, rankVision, takesArray = self.getPieceBoardVision(piece.pieceType, piece.file, piece.rank, piece.moveCounter, piece.pieceColor)
+        if(not (file, rank) in zip(fileVision, rankVision) or not self.isMoveLegal(piece, file, rank)):
+            return None
+        
+        isPromotion = piece.pieceType == PieceType.PAWN and (rank == "1" or rank == "8")
+        if(isPromotion != (promotion != "")):
+            return None
+        
+        movingPieces = [piece]
+        if(piece.pieceType == PieceType.KING and piece.file == "e" and (file == "g" or file == "c")):
+            rookFile = "h" if file == "g" else "a"
+            movingPieces.append(self.getPieceAtPosition(rookFile, rank))
+        return movingPieces, file, rank, promotion
+    
+    def getMoveSAN(self, piece, file, rank, promotion):
+        '''
+        SAN of a legal move of the side to move, without check marks. Only the pieces
+        of the same type that can also reach the destination are looked at for the 
+        disambiguation.
+        '''
+        if(piece.pieceType == PieceType.KING and piece.file == "e" and file == "g"):
+            return "O-O"
+        if(piece.pieceType == PieceType.KING and piece.file == "e" and file == "c"):
+            return "O-O-O"
+        
+        takes = "x" if self.isOccupiedByEnemyPiece(file, rank, PieceColor(1 - piece.pieceColor.value)) else ""
+        if(promotion != ""):
+            promotion = "=" + promotion
+        if(piece.pieceType == PieceType.PAWN):
+            #Pawns only move diagonally to take
+            if(piece.file != file):
+                return piece.file + "x" + file + rank + promotion
+            return file + rank + promotion
+        
+        otherPieces = []
+        for otherPiece in self.pieces:
+            if(otherPiece is piece or otherPiece.pieceColor != piece.pieceColor or otherPiece.pieceType != piece.pieceType):
+                continue
+            fileVision, rankVision, takesArray = self.getPieceBoardVision(otherPiece.pieceType, otherPiece.file, otherPiece.rank, otherPiece.moveCounter, otherPiece.pieceColor)
+            if((file, rank) in zip(fileVision, rankVision) and self.isMoveLegal(otherPiece, file, rank)):
+                otherPieces.append(otherPiece)
+        
+        fromFile, fromRank = self.getDisambiguation(piece, otherPieces)
+        return piece.pieceType.value + fromFile + fromRank + takes + file + rank + promotion
+    
+    def pushMoveUCI(self, uciMove, san = False):
+        '''
+        Plays a move given in UCI notation ("e2e4", "e7e8q", "e1g1" for castling). The
+        move lists of the side to move are not recomputed until something needs them
+        (findMove, getNMoves, ...), so a game given this way replays without testing
+        every candidate move for check and checkmate. The move is recorded in long
+        algebraic notation ("Ng1f3", "e5xd6", "O-O"), or in SAN when san is True; 
+        getSANMoves gives the SAN of the whole game later on. Returns False (leaving
+        the board untouched) when the move is not legal.
+        '''
+        uciMoveInfo = self.findMoveUCI(uciMove)
+        if(uciMoveInfo is None):
+            return False
+        movingPieces, file, rank, promotion = uciMoveInfo
+        piece = movingPieces[0]
+        
+        longNotation = len(movingPieces) == 1 and not san
+        if(longNotation):
+            takes = ""
+            if(self.isOccupiedByEnemyPiece(file, rank, PieceColor(1 - piece.pieceColor.value)) or (piece.pieceType == PieceType.PAWN and piece.file != file)):
+                takes = "x"
+            moveString = piece.pieceType.value + piece.file + piece.rank + takes + file + rank
+            if(promotion != ""):
+                moveString = moveString + "=" + promotion
+        else:
+            moveString = self.getMoveSAN(piece, file, rank, promotion)
+        
+        self.playMove(ChessMove(moveString, False), movingPieces, True)
+        self.moveStack[-1].longNotation = longNotation
+        return True
+    
+    def playMove(self, move, movingPieces, deferMoveUpdate):
+        '''
+        Moves the pieces of a move on the board, stacks its undo record and updates 
+        the moves of the other side, or only marks them pending when deferMoveUpdate
+        is True. Check and checkmate come from the marks of an annotated move, and
+        from the board otherwise.
+        '''
         pieceColorToMove = PieceColor(self.moveNumber % 2)
         self.toMoveColor = pieceColorToMove
-        madeMove = False
         check = False
         checkmate = False
         takes = False
-        removed = []
-        for i in range(0,len(self.pieces)):
-            piece = self.pieces[i]
-            pieceMoves = piece.getPieceMoves()
-            move = ChessMove(moveString)
-            if(move in pieceMoves and piece.pieceColor == pieceColorToMove):
-                takes, check, checkmate = move.executeMove(piece)
-                if(len(self.executedMoves) <= self.moveNumber):
-                    self.executedMoves.append(move)
-                if(takes):
-                    takenPosition = move.getPieceFinalPosition()
-                    #En passant is a dumbo case which should not exist. 
-                    if(piece.pieceType == PieceType.PAWN and (piece.rank == "4" or piece.rank == "5") and self.getPieceAtPosition(takenPosition[0], takenPosition[1]) is None):
-                        color = PieceColor((self.moveNumber + 1)%2)
-                        if(color == PieceColor.WHITE):
-                            removed.append([takenPosition[0],str(int(takenPosition[1]) - 1), color])
-                        else:
-                            removed.append([takenPosition[0],str(int(takenPosition[1]) + 1), color])
-                        
+        enemyColor = PieceColor((self.moveNumber + 1)%2)
+        
+        record = MoveUndoRecord(move, self)
+        changedSquares = 0
+        for i in range(0,len(movingPieces)):
+            piece = movingPieces[i]
+            record.movedPieces.append([piece, piece.file, piece.rank, piece.pieceType, piece.moveCounter])
+            if(move.moveString.startswith("O-O") and piece.pieceType == PieceType.ROOK):
+                record.castlingRook = piece
+            
+            changedSquares = changedSquares | (1 << piece.getSquareIndex())
+            takenPiece = None
+            if(move.takes):
+                #The taken piece leaves the board before the square index is overwritten
+                takenPosition = move.getPieceFinalPosition()
+                takenPiece = self.getPieceAtPosition(takenPosition[0], takenPosition[1])
+                #En passant is a dumbo case which should not exist. 
+                if(piece.pieceType == PieceType.PAWN and takenPiece is None):
+                    if(enemyColor == PieceColor.WHITE):
+                        takenPiece = self.getPieceAtPosition(takenPosition[0],str(int(takenPosition[1]) + 1))
                     else:
-                        removed.append([takenPosition[0], takenPosition[1], PieceColor((self.moveNumber + 1)%2)])
-                
-                madeMove = True
-                    
-        for i in range(0,len(removed)):
-            removeParams = removed[i]
-            self.removePiece(removeParams[0], removeParams[1], removeParams[2])
+                        takenPiece = self.getPieceAtPosition(takenPosition[0],str(int(takenPosition[1]) - 1))
+                    record.enPassantVictim = takenPiece
+            
+            if((not takenPiece is None) and takenPiece.pieceColor == enemyColor):
+                record.capturedPiece = takenPiece
+                record.capturedIndex = self.pieces.index(takenPiece)
+                self.removePiece(takenPiece.file, takenPiece.rank, enemyColor)
+                changedSquares = changedSquares | (1 << takenPiece.getSquareIndex())
+                self.dirtyTypes[enemyColor.value].add(takenPiece.pieceType)
+            
+            takes, check, checkmate = move.executeMove(piece, self)
+            if(piece.pieceType != record.movedPieces[-1][3]):
+                record.promotionType = piece.pieceType
+            changedSquares = changedSquares | (1 << piece.getSquareIndex())
+        self.executedMoves.append(move)
+        
+        #A double step opens the square passed to en passant for one move, both the
+        #old and the new square change what pawns can take
+        if(self.enPassantSquare >= 0):
+            changedSquares = changedSquares | (1 << self.enPassantSquare)
+        self.enPassantSquare = -1
+        movedPiece = record.movedPieces[0]
+        if(movedPiece[3] == PieceType.PAWN and abs(movedPiece[0].getSquareIndex() - SQUARE_INDEX[movedPiece[1] + movedPiece[2]]) == 16):
+            passedSquare = (movedPiece[0].getSquareIndex() + SQUARE_INDEX[movedPiece[1] + movedPiece[2]])//2
+            if(self.squares[passedSquare] is None):
+                self.enPassantSquare = passedSquare
+                changedSquares = changedSquares | (1 << passedSquare)
+        
+        if(movedPiece[3] == PieceType.PAWN or not record.capturedPiece is None):
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock = self.halfmoveClock + 1
+        
+        #The king (not the rook) gives the origin and destination of castling
+        uciPiece = record.movedPieces[0]
+        if(uciPiece[0] is record.castlingRook):
+            uciPiece = record.movedPieces[1]
+        record.uciMove = uciPiece[1] + uciPiece[2] + uciPiece[0].file + uciPiece[0].rank
+        if(not record.promotionType is None):
+            record.uciMove = record.uciMove + record.promotionType.value.lower()
+        
+        #Only the move played gets its check and checkmate marks
+        if(not move.annotated):
+            check = self.isKingAttacked(enemyColor)
+            checkmate = check and not self.hasLegalReply(enemyColor)
+            if(checkmate):
+                move.setMoveString(move.moveString + "#")
+            elif(check):
+                move.setMoveString(move.moveString + "+")
+            move.annotated = True
         
+        if(checkmate):
+            self.gameEnded = True
+            self.winner = pieceColorToMove
+        
+        #Recompute the available moves of the side to move, keeping the old lists for popMove
+        for i in range(0,len(self.pieces)):
+            if(self.pieces[i].pieceColor == enemyColor):
+                record.previousMoveLists.append([self.pieces[i], self.pieces[i].pieceMoves])
+        
+        self.dirtySquares[0] = self.dirtySquares[0] | changedSquares
+        self.dirtySquares[1] = self.dirtySquares[1] | changedSquares
+        if(deferMoveUpdate):
+            self.pendingMoveUpdates[enemyColor.value] = True
+            self.moveIndex[enemyColor.value] = None
+        else:
+            self.updateSideMoves(enemyColor, check, checkmate)
+        
+        self.moveNumber = self.moveNumber + 1
+        self.moveStack.append(record)
+    
+    def popMove(self):
+        '''
+        Takes back the last move played with pushMove (or makeMove) and returns it,
+        None if there is nothing to take back.
+        '''
+        if(len(self.moveStack) == 0):
+            return None
+        
+        record = self.moveStack.pop()
+        for i in range(len(record.movedPieces) - 1, -1, -1):
+            piece, file, rank, pieceType, moveCounter = record.movedPieces[i]
+            self.clearSquare(piece.file, piece.rank)
+            piece.setPosition(file, rank)
+            piece.setPieceType(pieceType)
+            piece.moveCounter = moveCounter
+            self.setSquare(file, rank, piece)
+        
+        capturedPiece = record.capturedPiece
+        if(not capturedPiece is None):
+            self.pieces.insert(record.capturedIndex, capturedPiece)
+            self.setSquare(capturedPiece.file, capturedPiece.rank, capturedPiece)
+        
+        for i in range(0,len(record.previousMoveLists)):
+            piece, pieceMoves = record.previousMoveLists[i]
+            piece.setPieceMoves(pieceMoves)
+        self.moveIndex = [None, None]
+        
+        record.restoreBoardState(self)
+        return record.move
+    
+    def makeMove(self, moveString):
+        madeMove = self.pushMove(moveString)
+                    
         if(not madeMove):
             if(not self.gameEnded):
                 print("Invalid move")
                 return -1
             else:
                 print("Game ended")
-        else:
-            if(checkmate):
-                self.gameEnded = True
-                self.winner = pieceColorToMove
-                if(pieceColorToMove == PieceColor.WHITE):
-                    print("White wins!")
-                else:
-                    print("Black wins!")
-            
-            #If a move was made recompute the available moves for each piece
-            for i in range(0,len(self.pieces)):
-                if(self.pieces[i].pieceColor != pieceColorToMove):
-                    self.pieces[i].resetPieceMoves()
-            
-            for i in range(0,len(self.pieces)):
-                if(self.pieces[i].pieceColor != pieceColorToMove):
-                    self.pieces[i].computePieceMoves(self, check, checkmate)
-            
-            self.moveNumber = self.moveNumber + 1
+        elif(self.gameEnded):
+            if(self.winner == PieceColor.WHITE):
+                print("White wins!")
+            else:
+                print("Black wins!")
             
     
+    def makeMoveUCI(self, uciMove, san = False):
+        '''
+        makeMove for moves in UCI notation, see pushMoveUCI
+        '''
+        madeMove = self.pushMoveUCI(uciMove, san)
+        
+        if(not madeMove):
+            if(not self.gameEnded):
+                print("Invalid move")
+                return -1
+            else:
+                print("Game ended")
+        elif(self.gameEnded):
+            if(self.winner == PieceColor.WHITE):
+                print("White wins!")
+            else:
+                print("Black wins!")
+    
+    def getSANMoves(self):
+        '''
+        SAN of every move played. Moves recorded in long algebraic notation by
+        pushMoveUCI are taken back and played again to write their SAN, which is
+        also stored in executedMoves.
+        '''
+        firstLongMove = len(self.moveStack)
+        for i in range(0,len(self.moveStack)):
+            if(self.moveStack[i].longNotation):
+                firstLongMove = i
+                break
+        
+        uciMoves = []
+        while(len(self.moveStack) > firstLongMove):
+            uciMoves.append(self.moveStack[-1].uciMove)
+            self.popMove()
+        for i in range(len(uciMoves) - 1, -1, -1):
+            self.pushMoveUCI(uciMoves[i], True)
+        
+        return [move.moveString for move in self.executedMoves]
+    
     def getNMoves(self, pieceColor):
+        self.ensureSideMoves(pieceColor)
         nMoves = 0
         for i in range(0,len(self.pieces)):
             if(self.pieces[i].pieceColor == pieceColor):
@@ -1328,31 +2591,15 @@ class ChessBoard:
         
             
         
-    def drawBoard(self):
-        fig, ax = plt.subplots(figsize = (4,4))
-        for i in range(0,8):
-            for j in range(0,8):
-                if((i%2 == 0 and j%2 == 1) or (i%2 == 1 and j%2 == 0)):
-                    ax.add_patch(Rectangle((i,j), 1,1, facecolor = self.whiteColor, fill = True, edgecolor = "none"))
-                else:
-                    ax.add_patch(Rectangle((i,j),1,1,facecolor = self.blackColor, fill = True, edgecolor = "none"))
-        coordTranslator = ChessCoordinateTranslator()
-        pieceRenderer = PieceImageRenderer("PieceImages")
-        for i in range(0,len(self.pieces)):
-            piece = self.pieces[i]
-            pieceimage = pieceRenderer.getPieceImage(200,200, piece.pieceType, piece.pieceColor)
-            imageBox = OffsetImage(pieceimage, zoom = 0.15)
-            pieceCoordinates = coordTranslator.getImageCoordinates(piece.file, piece.rank)
-            
-            annotationBox = AnnotationBbox(imageBox, (pieceCoordinates[1]+0.5,pieceCoordinates[0]+0.5), frameon = False)
-            ax.add_artist(annotationBox)
-        
-        ticksArray = ["a","b","c","d","e","f","g","h"]
-        ticksPositions = np.arange(0.5,8,1)
-        ticksArray2 = np.arange(1,9,1)
-        ax.set_xticks(ticksPositions)
-        ax.set_xticklabels(ticksArray)
-        ax.set_yticks(ticksPositions)
-        ax.set_yticklabels(ticksArray2)
-        ax.set_xlim([0,8])
-        ax.set_ylim([0,8])
\ No newline at end of file
+    def drawBoard(self, inPlace = False):
+        '''
+        Draws the board on a new figure or, with inPlace, on the figure of the last
+        call, changing only the squares whose piece changed. The figure is kept in
+        boardFigure.
+        '''
+        if(not inPlace or self.boardFigure is None):
+            self.boardFigure = BoardFigure(self.whiteColor, self.blackColor)
+            self.boardFigure.update(self)
+            return
+        self.boardFigure.update(self)
+        self.boardFigure.draw()
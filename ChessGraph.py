@@ -1,13 +1,24 @@
 import matplotlib.pyplot as plt
 import numpy as np
-from ChessGame import ChessCoordinateTranslator
+from matplotlib.collections import LineCollection
+from ChessGame import ChessBoard, SQUARE_INDEX, FILE_NAMES, RANK_NAMES, EDGE_TYPES
+from ChessBitboard import getSquareIndices
+from ChessGraphMetrics import getBetweenness, getPageRank, getEigenvectorCentrality, getClustering, getStronglyConnectedComponents, getReciprocity
+
+#(x, y) of each square in the graph drawings, in SQUARE_INDEX order: file and rank from 0
+SQUARE_COORDINATES = np.array([(index % 8, index // 8) for index in range(0,64)], dtype = float)
 
 
 class ChessConnection:
 
+    __slots__ = ("fromSquare", "toSquare", "fromIndex", "toIndex", "weight")
+
     def __init__(self, fromFile, fromRank, toFile, toRank, weight):
         self.fromSquare = fromFile + fromRank
         self.toSquare = toFile + toRank
+        #Square indices as in SQUARE_INDEX
+        self.fromIndex = SQUARE_INDEX[self.fromSquare]
+        self.toIndex = SQUARE_INDEX[self.toSquare]
         self.weight = weight
 
     def getFromFile(self):
@@ -23,119 +34,129 @@ class ChessConnection:
         return self.toSquare[1]
 
     def __eq__(self, other):
-        return self.fromSquare == other.fromSquare and self.toSquare == other.toSquare
+        return self.fromIndex == other.fromIndex and self.toIndex == other.toIndex
 
 class ChessNode:
+
+    __slots__ = ("file", "rank", "squareIndex")
+
     def __init__(self, file, rank):
         self.file = file
         self.rank = rank
+        self.squareIndex = SQUARE_INDEX[file + rank]
 
     def __eq__(self, other):
-        return self.file == other.file and self.rank == other.rank
+        return self.squareIndex == other.squareIndex
 
     def getId(self):
         return self.file + self.rank
     
 
 class ChessGraph:
+    '''
+    Vision graph of the pieces of a board. The graph lives in a 64 x 64 weight 
+    matrix, adjacency[i, j] being the weight of the connection from square i to 
+    square j (squares indexed as in SQUARE_INDEX, a1 = 0). nodes and connections
+    give the same graph as ChessNode and ChessConnection objects, built when first used.
+    
+    With typedEdges the same vision pass also fills one layer per edge type of 
+    EDGE_TYPES (move, capture, defend, xray), adjacency being move + capture.
+    '''
     
-    def __init__(self, board, filterColor, color):
+    def __init__(self, board, filterColor, color, typedEdges = False):
         self.board = board
-        self.nodes = []
-        self.connections = {}
+        self.adjacency = np.zeros((64, 64), dtype = np.float32)
+        self.layers = None
+        if(typedEdges):
+            self.layers = {edgeType: np.zeros((64, 64), dtype = np.float32) for edgeType in EDGE_TYPES}
+        self.nodeView = None
+        self.connectionView = None
+        #Identifies the graph in the board transposition cache
+        self.metricsKey = (board.getZobristKey(), filterColor, color)
         self.createGraph(filterColor, color)
 
+    @property
+    def nodes(self):
+        if(self.nodeView is None):
+            self.nodeView = [ChessNode(file, rank) for file in FILE_NAMES for rank in RANK_NAMES]
+        return self.nodeView
+
+    @property
+    def connections(self):
+        if(self.connectionView is None):
+            self.connectionView = {}
+            for node in self.nodes:
+                fromIndex = node.squareIndex
+                nodeConnections = []
+                for toIndex in np.flatnonzero(self.adjacency[fromIndex]):
+                    toFile = FILE_NAMES[toIndex % 8]
+                    toRank = RANK_NAMES[toIndex // 8]
+                    nodeConnections.append(ChessConnection(node.file, node.rank, toFile, toRank, float(self.adjacency[fromIndex, toIndex])))
+                self.connectionView[node.getId()] = nodeConnections
+        return self.connectionView
+
+    def getVisionSquares(self, piece):
+        if(self.board.visionBackend == "bitboard"):
+            return getSquareIndices(self.board.getVisionBitboard(piece.pieceType, piece.file, piece.rank, piece.moveCounter, piece.pieceColor))
+        
+        files, ranks, takes = self.board.getPieceBoardVision(piece.pieceType, piece.file, piece.rank, piece.moveCounter, piece.pieceColor)
+        return [SQUARE_INDEX[files[j] + ranks[j]] for j in range(0,len(files))]
+
     def createGraph(self, filterColor, color):
         pieces = self.board.pieces
         nPieces = len(pieces)
-
-        fileNames = ["a", "b", "c", "d", "e", "f", "g", "h"]
-        rankNames = ["1", "2", "3", "4", "5", "6", "7", "8"]
-
-        for i in range(0, len(fileNames)):
-            for j in range(0,len(rankNames)):
-                file = fileNames[i]
-                rank = rankNames[j]
-                node = ChessNode(file, rank)
-                self.addNode(node)
-                
-
-        if(filterColor):
-            for i in range(0,nPieces):
-                piece = pieces[i]
-                if(piece.pieceColor == color):
-                    files, ranks, takes = self.board.getPieceBoardVision(piece.pieceType, piece.file, piece.rank, piece.moveCounter, piece.pieceColor)
-                    rank = piece.rank
-                    file = piece.file
-                    for j in range(0,len(files)):
-                        self.addConnection(file, rank, files[j], ranks[j])
-            
-        else:
-            for i in range(0,nPieces):
-                piece = pieces[i]
-                files, ranks, takes = self.board.getPieceBoardVision(piece.pieceType, piece.file, piece.rank, piece.moveCounter, piece.pieceColor)
-                rank = piece.rank
-                file = piece.file
-                for j in range(0,len(files)):
-                    self.addConnection(file, rank, files[j], ranks[j])
-
+        for i in range(0,nPieces):
+            piece = pieces[i]
+            if(filterColor and piece.pieceColor != color):
+                continue
+            fromIndex = piece.getSquareIndex()
+            #Connections will have a weight of 1
+            if(self.layers is None):
+                self.adjacency[fromIndex, self.getVisionSquares(piece)] = 1
+            else:
+                typedVision = self.board.getTypedVisionBitboards(piece.pieceType, piece.file, piece.rank, piece.moveCounter, piece.pieceColor)
+                for j in range(0,len(EDGE_TYPES)):
+                    self.layers[EDGE_TYPES[j]][fromIndex, getSquareIndices(typedVision[j])] = 1
+                self.adjacency[fromIndex, getSquareIndices(typedVision[0] | typedVision[1])] = 1
+        
+        self.connectionView = None
 
     def addNode(self, node):
-        if(not node in self.nodes):
-            self.nodes.append(node)
-            self.connections[node.getId()] = []
+        #The 64 squares are always nodes of the graph
+        pass
 
     def getNodeById(self, nodeId):
-        file = nodeId[0]
-        rank = nodeId[1]
-        nNodes = len(self.nodes)
-        
-        for i in range(0,nNodes):
-            node = self.nodes[i]
-            if(file == node.file and rank == node.rank):
-                return node
+        squareIndex = SQUARE_INDEX.get(nodeId)
+        if(squareIndex is None):
+            return -1
         
-        return -1
-
-    def addConnection(self, fromFile, fromRank, toFile, toRank):
-
-        nodeId = fromFile + fromRank
-
-        #Connections will have a weight of 1
-        connection = ChessConnection(fromFile, fromRank, toFile, toRank, 1)
-        if (not connection in self.connections[nodeId]):
-            self.connections[nodeId].append(connection)
-
-    def drawGraph(self):
-        plt.figure(figsize = (4,4))
-        #Draw the connections 
-        connections = self.getAllConnections()
-        nConnections = len(connections)
-        coordTranslator = ChessCoordinateTranslator()
-        connectionColor = ""
-
-        for i in range(0,nConnections):
-            connection = connections[i]
-            fromFile = connection.getFromFile()
-            fromRank = connection.getFromRank()
-            toFile = connection.getToFile()
-            toRank = connection.getToRank()
-
-            [fromY, fromX] = coordTranslator.getImageCoordinates(fromFile, fromRank)
-            [toY, toX] = coordTranslator.getImageCoordinates(toFile, toRank)
+        return self.nodes[(squareIndex % 8)*8 + squareIndex // 8]
+
+    def addConnection(self, fromFile, fromRank, toFile, toRank, weight = 1):
+        self.adjacency[SQUARE_INDEX[fromFile + fromRank], SQUARE_INDEX[toFile + toRank]] = weight
+        self.connectionView = None
+        #An edited graph no longer matches its position
+        self.metricsKey = None
+
+    def drawGraph(self, ax = None, colorByWeight = False, colorMap = "viridis"):
+        '''
+        Draws the graph on ax (a new figure by default): the connections as a single
+        line collection, coloured by weight with colorByWeight, and the squares as a
+        single scatter
+        '''
+        if(ax is None):
+            fig, ax = plt.subplots(figsize = (4,4))
+        fromIndices, toIndices = np.nonzero(self.adjacency)
+        segments = np.stack([SQUARE_COORDINATES[fromIndices], SQUARE_COORDINATES[toIndices]], axis = 1)
+        if(colorByWeight):
+            lines = LineCollection(segments, linewidths = 2, cmap = colorMap, zorder = 1)
+            lines.set_array(self.adjacency[fromIndices, toIndices])
+            ax.figure.colorbar(lines, ax = ax, label = "Weight")
+        else:
+            lines = LineCollection(segments, linewidths = 2, colors = "#37a7ed", zorder = 1)
+        ax.add_collection(lines)
 
-            plt.plot([fromX, toX], [fromY, toY], marker = "none", linewidth = 2, color = "#37a7ed")
-        
-        #Let's draw the nodes
-        nodeColor = "#c95e20"
-        nNodes = len(self.nodes)
-        
-        for i in range(0,nNodes):
-            node = self.nodes[i]
-            file = node.file
-            rank = node.rank
-            [yPos,xPos] = coordTranslator.getImageCoordinates(file,rank)
-            plt.plot([xPos], [yPos], marker = "o", markersize = 5, color = nodeColor)
+        ax.scatter(SQUARE_COORDINATES[:, 0], SQUARE_COORDINATES[:, 1], s = 25, color = "#c95e20", zorder = 2)
 
     def getAllConnections(self):
         nNodes = len(self.nodes)
@@ -148,26 +169,166 @@ class ChessGraph:
         return connections
 
 
-    def getAverageDegree(self):
-        avgDegree = 0
-        for i in range(0,len(self.nodes)):
-            node = self.nodes[i]
-            nodeId = node.getId()
-            degree = len(self.connections[nodeId])
-            avgDegree = avgDegree + degree/len(self.nodes)
-
-
-        return avgDegree
-            
-            
-            
-        
+    def getOutDegrees(self):
+        '''
+        Number of connections leaving each square, in SQUARE_INDEX order
+        '''
+        return np.count_nonzero(self.adjacency, axis = 1)
+
+    def getInDegrees(self):
+        '''
+        Number of connections reaching each square, in SQUARE_INDEX order
+        '''
+        return np.count_nonzero(self.adjacency, axis = 0)
+
+    def getDegrees(self):
+        return self.getOutDegrees() + self.getInDegrees()
+
+    def getNConnections(self):
+        return int(np.count_nonzero(self.adjacency))
+
+    def getDensity(self):
+        '''
+        Connections over the 64*63 possible ones
+        '''
+        return self.getNConnections()/(64*63)
+
+    def getCachedMetric(self, name, metricFunction):
+        '''
+        Value of a metric of the adjacency matrix, kept in the board transposition
+        cache for graphs of the same position
+        '''
+        cache = self.board.transpositionCache
+        if(cache is None or self.metricsKey is None):
+            return metricFunction(self.adjacency)
         
+        value = cache.get(name, self.metricsKey)
+        if(value is None):
+            value = metricFunction(self.adjacency)
+            #Cached arrays are shared between graphs
+            for array in (value if isinstance(value, tuple) else (value,)):
+                if(isinstance(array, np.ndarray)):
+                    array.flags.writeable = False
+            cache.put(name, self.metricsKey, value)
+        return value
 
+    def getAverageDegree(self):
+        '''
+        Average number of connections leaving a square
+        '''
+        return self.getCachedMetric("averageDegree", lambda adjacency: int(np.count_nonzero(adjacency))/64)
+
+    def getBetweenness(self):
+        return self.getCachedMetric("betweenness", getBetweenness)
+
+    def getPageRank(self):
+        return self.getCachedMetric("pageRank", getPageRank)
+
+    def getEigenvectorCentrality(self):
+        return self.getCachedMetric("eigenvectorCentrality", getEigenvectorCentrality)
+
+    def getClustering(self):
+        return self.getCachedMetric("clustering", getClustering)
+
+    def getStronglyConnectedComponents(self):
+        '''
+        Component label of each square and the number of components
+        '''
+        return self.getCachedMetric("stronglyConnectedComponents", getStronglyConnectedComponents)
+
+    def getLayer(self, edgeTypes):
+        '''
+        Adjacency matrix of the connections of the given edge types (a name or a
+        list of names of EDGE_TYPES), the graph has to be built with typedEdges
+        '''
+        if(isinstance(edgeTypes, str)):
+            edgeTypes = [edgeTypes]
+        layer = np.zeros((64, 64), dtype = np.float32)
+        for edgeType in edgeTypes:
+            layer = np.maximum(layer, self.layers[edgeType])
+        return layer
+
+    def getReciprocity(self, edgeTypes = None):
+        '''
+        Fraction of the connections between pieces that go both ways, over the
+        vision graph or, for a typed graph, the layers in edgeTypes (["capture", 
+        "defend"] for mutual attack and defence)
+        '''
+        occupied = np.array([not square is None for square in self.board.squares])
+        if(edgeTypes is None):
+            return self.getCachedMetric("reciprocity", lambda adjacency: float(getReciprocity(adjacency, occupied)))
         
+        if(isinstance(edgeTypes, str)):
+            edgeTypes = [edgeTypes]
+        layer = self.getLayer(edgeTypes)
+        return self.getCachedMetric(("reciprocity",) + tuple(edgeTypes), lambda adjacency: float(getReciprocity(layer, occupied)))
+
+class GameGraphSeries:
+    '''
+    Vision graphs of every position of a game, from the initial position (ply 0)
+    to the last move. Each graph is kept as 64 bitboards, one per square with the
+    squares its piece sees, so bits[side] is an (n plies x 64 x 64) bit tensor 
+    packed in an (n plies x 64) uint64 array, side being "white", "black" or 
+    "combined".
+    '''
+
+    def __init__(self, gameMoves, **boardOptions):
+        '''
+        Replays gameMoves (move strings as given to makeMove) on a new ChessBoard,
+        boardOptions go to its constructor. The series stops at an invalid move.
+        '''
+        board = ChessBoard(**boardOptions)
+        board.initializeBoard()
+        rows = [self.getVisionRows(board)]
+        for i in range(0,len(gameMoves)):
+            if(not board.pushMove(gameMoves[i])):
+                print("Invalid move")
+                break
+            rows.append(self.getVisionRows(board))
         
-
-
-        
-
-        
\ No newline at end of file
+        self.board = board
+        self.nPlies = len(rows)
+        rows = np.array(rows, dtype = np.uint64)
+        self.bits = {"white": rows[:, 0], "black": rows[:, 1]}
+        self.bits["combined"] = self.bits["white"] | self.bits["black"]
+
+    def getVisionRows(self, board):
+        rows = [[0]*64, [0]*64]
+        for piece in board.pieces:
+            rows[piece.pieceColor.value][piece.getSquareIndex()] = board.getVisionBitboard(piece.pieceType, piece.file, piece.rank, piece.moveCounter, piece.pieceColor)
+        return rows
+
+    def unpack(self, bits):
+        #Bit j of a row is square j, little endian bytes keep that order
+        return np.unpackbits(bits.view(np.uint8).reshape(bits.shape + (8,)), axis = -1, bitorder = "little").astype(bool)
+
+    def getAdjacency(self, side = "combined"):
+        '''
+        Boolean (n plies x 64 x 64) tensor, [p, i, j] tells if square i sees square j after ply p
+        '''
+        return self.unpack(self.bits[side])
+
+    def countBits(self, bits):
+        return np.unpackbits(bits.view(np.uint8), axis = -1).reshape(bits.shape + (64,)).sum(axis = -1)
+
+    def getOutDegrees(self, side = "combined"):
+        return self.countBits(self.bits[side])
+
+    def getAverageDegree(self, side = "combined"):
+        '''
+        Average number of connections leaving a square at each ply, as in ChessGraph
+        '''
+        return self.getOutDegrees(side).sum(axis = 1)/64
+
+    def getEdgeChurn(self, side = "combined"):
+        '''
+        Connections created plus connections lost by each move (n plies - 1 values)
+        '''
+        changes = self.bits[side][1:] ^ self.bits[side][:-1]
+        return self.countBits(changes).sum(axis = 1)
+
+    def getSquareControl(self, side = "combined"):
+        '''
+        Number of pieces seeing each square at each ply, (n plies x 64) in SQUARE_INDEX order
+        '''
+        return self.getAdjacency(side).sum(axis = 1)
@@ -0,0 +1,153 @@
+'''
+Network metrics of vision graphs computed on their adjacency matrices. Every
+function takes an (64 x 64) matrix, or a stack of them (... x 64 x 64) such as
+GameGraphSeries.getAdjacency(), and treats any non zero entry as a connection.
+Results are indexed by square as in SQUARE_INDEX.
+'''
+import numpy as np
+
+
+def toBinary(adjacency):
+    binary = (np.asarray(adjacency) != 0).astype(np.float64)
+    #Self loops are not part of any of the metrics
+    nNodes = binary.shape[-1]
+    binary[..., np.arange(nNodes), np.arange(nNodes)] = 0
+    return binary
+
+
+def getShortestPaths(adjacency):
+    '''
+    Distances (inf when unreachable) and number of shortest paths between every
+    pair of squares. Walks of the first length reaching a square are all shortest
+    paths, so both come out of successive matrix products.
+    '''
+    binary = toBinary(adjacency)
+    nNodes = binary.shape[-1]
+    distances = np.full(binary.shape, np.inf)
+    pathCounts = np.zeros(binary.shape)
+    identity = np.broadcast_to(np.eye(nNodes, dtype = bool), binary.shape)
+    distances[identity] = 0
+    pathCounts[identity] = 1
+
+    walks = np.broadcast_to(np.eye(nNodes), binary.shape)
+    for length in range(1, nNodes):
+        walks = walks @ binary
+        reached = (walks > 0) & np.isinf(distances)
+        if(not reached.any()):
+            break
+        distances[reached] = length
+        pathCounts[reached] = walks[reached]
+    return distances, pathCounts
+
+
+def getBetweenness(adjacency, normalized = True):
+    '''
+    Betweenness centrality: for each square, the fraction of shortest paths between
+    other pairs of squares going through it, divided by (n-1)(n-2) when normalized
+    '''
+    distances, pathCounts = getShortestPaths(adjacency)
+    nNodes = distances.shape[-1]
+    stackShape = distances.shape[:-2]
+    distances = distances.reshape((-1, nNodes, nNodes))
+    pathCounts = pathCounts.reshape((-1, nNodes, nNodes))
+    betweenness = np.zeros((distances.shape[0], nNodes))
+    others = ~np.eye(nNodes, dtype = bool)
+
+    for k in range(0,distances.shape[0]):
+        distance = distances[k]
+        pathCount = pathCounts[k]
+        reachable = np.isfinite(distance) & others
+        safeCount = np.where(reachable, pathCount, 1)
+        #through[s, v, t]: v lies on a shortest path from s to t
+        through = (distance[:, :, None] + distance[None, :, :]) == distance[:, None, :]
+        through = through & reachable[:, None, :]
+        through = through & others[:, :, None] & others[None, :, :]
+        share = pathCount[:, :, None]*pathCount[None, :, :]/safeCount[:, None, :]
+        betweenness[k] = np.where(through, share, 0).sum(axis = (0, 2))
+
+    if(normalized):
+        betweenness = betweenness/((nNodes - 1)*(nNodes - 2))
+    return betweenness.reshape(stackShape + (nNodes,))
+
+
+def getPageRank(adjacency, alpha = 0.85, tolerance = 1e-10, maxIterations = 200):
+    '''
+    PageRank by power iteration, squares without connections spread their rank evenly
+    '''
+    binary = toBinary(adjacency)
+    nNodes = binary.shape[-1]
+    outDegrees = binary.sum(axis = -1, keepdims = True)
+    transitions = np.where(outDegrees > 0, binary/np.maximum(outDegrees, 1), 1/nNodes)
+    ranks = np.full(binary.shape[:-1], 1/nNodes)
+    for iteration in range(0,maxIterations):
+        newRanks = alpha*(ranks[..., None, :] @ transitions)[..., 0, :] + (1 - alpha)/nNodes
+        converged = np.abs(newRanks - ranks).sum(axis = -1).max() < tolerance
+        ranks = newRanks
+        if(converged):
+            break
+    return ranks
+
+
+def getEigenvectorCentrality(adjacency, tolerance = 1e-10, maxIterations = 500):
+    '''
+    Eigenvector centrality from the connections reaching each square, with unit
+    norm. Iterates x <- x + A^T x, which converges on graphs that are not strongly
+    connected too.
+    '''
+    binary = toBinary(adjacency)
+    nNodes = binary.shape[-1]
+    centrality = np.full(binary.shape[:-1], 1/nNodes)
+    for iteration in range(0,maxIterations):
+        newCentrality = centrality + (centrality[..., None, :] @ binary)[..., 0, :]
+        newCentrality = newCentrality/np.maximum(np.linalg.norm(newCentrality, axis = -1, keepdims = True), 1e-300)
+        converged = np.abs(newCentrality - centrality).sum(axis = -1).max() < tolerance
+        centrality = newCentrality
+        if(converged):
+            break
+    return centrality
+
+
+def getClustering(adjacency):
+    '''
+    Directed clustering coefficient of each square (triangles in any direction over
+    the possible ones), 0 for squares with less than two neighbours
+    '''
+    binary = toBinary(adjacency)
+    symmetric = binary + np.swapaxes(binary, -1, -2)
+    triangles = np.diagonal(symmetric @ symmetric @ symmetric, axis1 = -2, axis2 = -1)
+    totalDegrees = symmetric.sum(axis = -1)
+    reciprocalDegrees = np.diagonal(binary @ binary, axis1 = -2, axis2 = -1)
+    possible = 2*(totalDegrees*(totalDegrees - 1) - 2*reciprocalDegrees)
+    return np.where(possible > 0, triangles/np.maximum(possible, 1), 0)
+
+
+def getStronglyConnectedComponents(adjacency):
+    '''
+    Component label of each square (the lowest square index of its component) and
+    the number of components, from the transitive closure of the graph
+    '''
+    binary = toBinary(adjacency) > 0
+    nNodes = binary.shape[-1]
+    reach = binary | np.eye(nNodes, dtype = bool)
+    #Squaring the reachability doubles the path length covered
+    for step in range(0,int(np.ceil(np.log2(nNodes)))):
+        reach = (reach.astype(np.float32) @ reach.astype(np.float32)) > 0
+    mutual = reach & np.swapaxes(reach, -1, -2)
+    labels = np.argmax(mutual, axis = -1)
+    nComponents = (labels == np.arange(nNodes)).sum(axis = -1)
+    return labels, nComponents
+
+
+def getReciprocity(adjacency, nodeMask = None):
+    '''
+    Fraction of connections whose reverse connection also exists. With nodeMask
+    (boolean, per square) only connections between masked squares are counted,
+    for instance the occupied squares to measure mutual attack and defence.
+    '''
+    binary = toBinary(adjacency) > 0
+    if(not nodeMask is None):
+        nodeMask = np.asarray(nodeMask, dtype = bool)
+        binary = binary & nodeMask[..., :, None] & nodeMask[..., None, :]
+    nConnections = binary.sum(axis = (-2, -1))
+    nReciprocated = (binary & np.swapaxes(binary, -1, -2)).sum(axis = (-2, -1))
+    return np.where(nConnections > 0, nReciprocated/np.maximum(nConnections, 1), 0)
@@ -0,0 +1,78 @@
+'''
+Zobrist keys and the transposition cache shared by the boards of a process.
+
+A position key is the XOR of one random number per (color, piece type, square),
+one per castling right (taken from the square of its rook), one for the en passant
+square and one for the side to move. Squares follow the SQUARE_INDEX convention of ChessGame.
+'''
+import random
+from collections import OrderedDict
+
+PIECE_LETTERS = ["", "R", "N", "Q", "B", "K"]
+
+def computeZobristTables(seed):
+    generator = random.Random(seed)
+    pieceTable = [{pieceLetter: [generator.getrandbits(64) for i in range(0,64)] for pieceLetter in PIECE_LETTERS} for colorIndex in range(0,2)]
+    unmovedTable = [generator.getrandbits(64) for i in range(0,64)]
+    sideTable = [0, generator.getrandbits(64)]
+    enPassantTable = [generator.getrandbits(64) for i in range(0,64)]
+    return pieceTable, unmovedTable, sideTable, enPassantTable
+
+#ZOBRIST_PIECES[colorIndex][pieceLetter][squareIndex]
+ZOBRIST_PIECES, ZOBRIST_UNMOVED, ZOBRIST_SIDE, ZOBRIST_EN_PASSANT = computeZobristTables(2023)
+
+#Castling rights in FEN notation with the squares of the king and rook that must not have moved
+CASTLING_RIGHTS = [("K", 4, 7), ("Q", 4, 0), ("k", 60, 63), ("q", 60, 56)]
+
+
+class TranspositionCache:
+    '''
+    Bounded least recently used cache of per position results. Entries are grouped
+    by kind ("moves", "averageDegree", ...) and hits and misses are counted per kind.
+    '''
+
+    def __init__(self, maxEntries = 200000):
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.hits = {}
+        self.misses = {}
+
+    def get(self, kind, key):
+        '''
+        Returns the stored value or None
+        '''
+        entryKey = (kind, key)
+        value = self.entries.get(entryKey)
+        if(value is None):
+            self.misses[kind] = self.misses.get(kind, 0) + 1
+        else:
+            self.hits[kind] = self.hits.get(kind, 0) + 1
+            self.entries.move_to_end(entryKey)
+        return value
+
+    def put(self, kind, key, value):
+        entryKey = (kind, key)
+        self.entries[entryKey] = value
+        self.entries.move_to_end(entryKey)
+        while(len(self.entries) > self.maxEntries):
+            self.entries.popitem(last = False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = {}
+        self.misses = {}
+
+    def getStats(self):
+        '''
+        Hit and miss counters, in total and per kind
+        '''
+        kinds = sorted(set(self.hits) | set(self.misses))
+        stats = {"entries": len(self.entries), "hits": sum(self.hits.values()), "misses": sum(self.misses.values()), "kinds": {}}
+        for kind in kinds:
+            stats["kinds"][kind] = {"hits": self.hits.get(kind, 0), "misses": self.misses.get(kind, 0)}
+        lookups = stats["hits"] + stats["misses"]
+        stats["hitRate"] = stats["hits"]/lookups if lookups > 0 else 0
+        return stats
+
+#Default cache of every ChessBoard, so positions repeated across games are reused
+sharedTranspositionCache = TranspositionCache()
@@ -0,0 +1,126 @@
+'''
+Columnar storage of per move metrics. A store is a folder with one raw binary file
+per typed column and a schema.json file with the column types, the number of
+rows written and free metadata. Rows are only appended, and columns can be opened
+one by one as read only memory maps.
+'''
+import os
+import json
+import numpy as np
+
+SCHEMA_NAME = "schema.json"
+
+
+class MetricsStore:
+
+    def __init__(self, folder, columnTypes = None):
+        '''
+        Opens the store in folder, creating it with columnTypes, a list of (name,
+        NumPy type) pairs, if it does not exist yet
+        '''
+        self.folder = folder
+        schemaPath = os.path.join(folder, SCHEMA_NAME)
+        if(os.path.exists(schemaPath)):
+            with open(schemaPath, "r") as schemaFile:
+                schema = json.load(schemaFile)
+            self.columnTypes = [(name, np.dtype(typeName)) for name, typeName in schema["columns"]]
+            self.nRows = schema["nRows"]
+            self.metadata = schema["metadata"]
+            if((not columnTypes is None) and [name for name, columnType in columnTypes] != self.getColumnNames()):
+                print("The store in " + folder + " has other columns, they are kept")
+        else:
+            if(columnTypes is None):
+                columnTypes = [("gameId", np.int64), ("ply", np.int16)]
+            os.makedirs(folder, exist_ok = True)
+            self.columnTypes = [(name, np.dtype(columnType)) for name, columnType in columnTypes]
+            self.nRows = 0
+            self.metadata = {}
+            self.writeSchema()
+
+    def clear(self, columnTypes = None):
+        '''
+        Empties the store (rows and metadata), switching to columnTypes if given
+        '''
+        for name, columnType in self.columnTypes:
+            columnPath = self.getColumnPath(name)
+            if(os.path.exists(columnPath)):
+                os.remove(columnPath)
+        if(not columnTypes is None):
+            self.columnTypes = [(name, np.dtype(columnType)) for name, columnType in columnTypes]
+        self.nRows = 0
+        self.metadata = {}
+        self.writeSchema()
+
+    def getColumnNames(self):
+        return [name for name, columnType in self.columnTypes]
+
+    def getColumnPath(self, name):
+        return os.path.join(self.folder, name + ".bin")
+
+    def writeSchema(self):
+        #The row count is only updated once the data is on disk
+        schema = {"columns": [[name, columnType.str] for name, columnType in self.columnTypes], "nRows": self.nRows, "metadata": self.metadata}
+        temporaryPath = os.path.join(self.folder, SCHEMA_NAME + ".tmp")
+        with open(temporaryPath, "w") as schemaFile:
+            json.dump(schema, schemaFile)
+        os.replace(temporaryPath, os.path.join(self.folder, SCHEMA_NAME))
+
+    def append(self, columns, metadata = None):
+        '''
+        Appends rows given as a dict of equally long sequences, one per column.
+        metadata entries are merged into the store metadata in the same write.
+        Returns -1 without writing anything if the columns do not match.
+        '''
+        nNewRows = len(columns[self.columnTypes[0][0]])
+        arrays = []
+        for name, columnType in self.columnTypes:
+            if(not name in columns):
+                print("Column " + name + " is missing")
+                return -1
+            values = np.asarray(columns[name], dtype = columnType)
+            if(len(values) != nNewRows):
+                print("Column " + name + " has " + str(len(values)) + " rows instead of " + str(nNewRows))
+                return -1
+            arrays.append(values)
+
+        for i in range(0,len(self.columnTypes)):
+            name, columnType = self.columnTypes[i]
+            values = arrays[i]
+            columnPath = self.getColumnPath(name)
+            with open(columnPath, "r+b" if os.path.exists(columnPath) else "wb") as columnFile:
+                #Drop whatever an interrupted append left after the last complete row
+                columnFile.truncate(self.nRows*columnType.itemsize)
+                columnFile.seek(self.nRows*columnType.itemsize)
+                columnFile.write(values.tobytes())
+
+        self.nRows = self.nRows + nNewRows
+        if(not metadata is None):
+            self.metadata.update(metadata)
+        self.writeSchema()
+
+    def appendGame(self, gameId, metrics, firstPly = 1):
+        '''
+        Appends the per move metrics of one game, given as lists indexed by move
+        (for instance whiteDegree and blackDegree of the degree analysis)
+        '''
+        nPlies = len(next(iter(metrics.values())))
+        columns = {"gameId": np.full(nPlies, gameId), "ply": np.arange(firstPly, firstPly + nPlies)}
+        columns.update(metrics)
+        return self.append(columns)
+
+    def getColumn(self, name):
+        '''
+        Read only memory map of a column
+        '''
+        columnType = dict(self.columnTypes)[name]
+        if(self.nRows == 0):
+            return np.zeros(0, dtype = columnType)
+        return np.memmap(self.getColumnPath(name), dtype = columnType, mode = "r", shape = (self.nRows,))
+
+    def loadColumns(self, names = None):
+        '''
+        Memory maps of the requested columns (all of them by default) by name
+        '''
+        if(names is None):
+            names = self.getColumnNames()
+        return {name: self.getColumn(name) for name in names}
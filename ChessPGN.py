@@ -0,0 +1,233 @@
+'''
+Streaming PGN reader. Games are read one at a time from the file, so the memory
+used does not grow with the size of the file, and replayed on a ChessBoard.
+
+A malformed game (bad tag, unbalanced variation or comment, move the board does
+not accept) is still yielded with its error set, and the stream goes on with the
+next game.
+'''
+import re
+import gzip
+import bz2
+import contextlib
+from ChessGame import ChessBoard
+
+TAG_PATTERN = re.compile(r'^\[\s*([A-Za-z0-9_]+)\s+"((?:[^"\\]|\\.)*)"\s*\]\s*$')
+MOVETEXT_TOKEN_PATTERN = re.compile(r'\{[^}]*\}|;[^\n]*|\(|\)|\$\d+|1-0|0-1|1/2-1/2|\*|\d+\.+|[^\s(){};$]+')
+MOVE_PATTERN = re.compile(r'^([NBRQK]?[a-h]?[1-8]?x?[a-h][1-8](=?[NBRQ])?|O-O(-O)?)[+#]?[!?]*$')
+RESULTS = ["1-0", "0-1", "1/2-1/2", "*"]
+#Annotations PGN writes as suffixes, given as $n glyphs
+SUFFIX_NAGS = {"!": 1, "?": 2, "!!": 3, "??": 4, "!?": 5, "?!": 6}
+
+
+class PGNLine:
+    '''
+    A sequence of moves with what is attached to them, keyed by ply: comments[p] 
+    and nags[p] come after the first p moves (0 is before the first move) and the
+    lines in variations[p] start from that same position, as alternatives to moves[p].
+    '''
+
+    def __init__(self):
+        self.moves = []
+        self.comments = {}
+        self.nags = {}
+        self.variations = {}
+
+    def addComment(self, comment):
+        self.comments.setdefault(len(self.moves), []).append(comment)
+
+    def addNag(self, nag):
+        self.nags.setdefault(len(self.moves), []).append(nag)
+
+    def addVariation(self, variation):
+        #A variation replaces the last move written
+        self.variations.setdefault(max(0, len(self.moves) - 1), []).append(variation)
+
+
+class PGNGame(PGNLine):
+
+    def __init__(self, lineNumber):
+        PGNLine.__init__(self)
+        self.tags = {}
+        self.result = "*"
+        self.error = None
+        #Line of the file where the game starts
+        self.lineNumber = lineNumber
+
+    def setError(self, error):
+        #The first problem found is the one reported
+        if(self.error is None):
+            self.error = error
+
+
+def openPGN(source):
+    '''
+    source is a path (plain, .gz or .bz2) or an already open text stream
+    '''
+    if(not isinstance(source, str)):
+        return contextlib.nullcontext(source)
+    if(source.endswith(".gz")):
+        return gzip.open(source, "rt", encoding = "utf-8", errors = "replace")
+    if(source.endswith(".bz2")):
+        return bz2.open(source, "rt", encoding = "utf-8", errors = "replace")
+    return open(source, "r", encoding = "utf-8", errors = "replace")
+
+
+def splitGameTexts(lines):
+    '''
+    Groups the lines of a PGN file into (line number, tag lines, movetext) per game.
+    A tag after a blank line closes a comment left open, which stays an error of
+    its game (unbalanced braces) instead of taking in the games that follow.
+    '''
+    tagLines = []
+    movetextLines = []
+    startLine = 1
+    openBraces = 0
+    previousBlank = False
+    for lineNumber, line in enumerate(lines, 1):
+        stripped = line.strip()
+        if(openBraces > 0 and previousBlank and stripped.startswith("[")):
+            openBraces = 0
+        previousBlank = stripped == ""
+        if(openBraces == 0 and stripped.startswith("%")):
+            continue
+
+        #A tag after some movetext starts the next game
+        if(openBraces == 0 and stripped.startswith("[")):
+            if(len(movetextLines) > 0):
+                yield startLine, tagLines, "\n".join(movetextLines)
+                tagLines = []
+                movetextLines = []
+            if(len(tagLines) == 0):
+                startLine = lineNumber
+            tagLines.append(stripped)
+            continue
+
+        if(stripped == "" and openBraces == 0):
+            continue
+
+        if(len(tagLines) == 0 and len(movetextLines) == 0):
+            startLine = lineNumber
+        movetextLines.append(stripped)
+        openBraces = max(0, openBraces + stripped.count("{") - stripped.count("}"))
+
+    if(len(tagLines) > 0 or len(movetextLines) > 0):
+        yield startLine, tagLines, "\n".join(movetextLines)
+
+
+def parseMovetext(game, movetext):
+    '''
+    Fills the moves, comments, nags and variations of a game from its movetext
+    '''
+    #Checked first, the text of an unclosed comment would be read as moves
+    if(movetext.count("{") != movetext.count("}")):
+        game.setError("Unbalanced comment braces")
+    lines = [game]
+    for token in MOVETEXT_TOKEN_PATTERN.findall(movetext):
+        line = lines[-1]
+        if(token.startswith("{")):
+            line.addComment(token[1:-1].strip())
+        elif(token.startswith(";")):
+            line.addComment(token[1:].strip())
+        elif(token.startswith("$")):
+            line.addNag(int(token[1:]))
+        elif(token == "("):
+            variation = PGNLine()
+            line.addVariation(variation)
+            lines.append(variation)
+        elif(token == ")"):
+            if(len(lines) == 1):
+                game.setError("Unbalanced ')' in the movetext")
+            else:
+                lines.pop()
+        elif(token in RESULTS):
+            if(len(lines) > 1):
+                game.setError("Result inside a variation")
+            game.result = token
+        elif(token[0].isdigit() and token.rstrip(".").isdigit()):
+            continue
+        else:
+            san = token.replace("0-0-0", "O-O-O").replace("0-0", "O-O")
+            suffix = san.lstrip("NBRQKabcdefghx12345678=O-+#")
+            if(suffix in SUFFIX_NAGS):
+                san = san[:len(san) - len(suffix)]
+            if(not MOVE_PATTERN.match(san)):
+                game.setError("Unreadable move '" + token + "'")
+                continue
+            line.moves.append(san)
+            if(suffix in SUFFIX_NAGS):
+                line.addNag(SUFFIX_NAGS[suffix])
+
+    if(len(lines) > 1):
+        game.setError("Unclosed variation")
+
+
+def readPGNGames(source):
+    '''
+    Generator of the PGNGame objects of a PGN file, one game in memory at a time
+    '''
+    with openPGN(source) as pgnFile:
+        for lineNumber, tagLines, movetext in splitGameTexts(pgnFile):
+            game = PGNGame(lineNumber)
+            for tagLine in tagLines:
+                match = TAG_PATTERN.match(tagLine)
+                if(match is None):
+                    game.setError("Malformed tag " + tagLine)
+                else:
+                    game.tags[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+            parseMovetext(game, movetext)
+            if(game.result == "*" and "Result" in game.tags):
+                game.result = game.tags["Result"]
+            yield game
+
+
+def findBoardMove(board, san):
+    '''
+    The move string of the side to move matching a SAN move, check marks and
+    annotations aside (the board and the file do not always agree on them). None
+    if there is no such move.
+    '''
+    move, pieces = board.findMove(san)
+    if(move is None):
+        return None
+    return move.moveString
+
+
+def replayPGNGame(game, onPly = None, **boardOptions):
+    '''
+    Plays the main line of a game on a new ChessBoard (boardOptions go to its
+    constructor) and returns the board, starting from the FEN tag when the game
+    has one. onPly(board, ply, san) is called after every move. A move the board
+    refuses sets game.error and stops the replay.
+    '''
+    if("FEN" in game.tags):
+        board = ChessBoard.fromFEN(game.tags["FEN"], **boardOptions)
+        if(board is None):
+            game.setError("Invalid FEN tag " + game.tags["FEN"])
+            return None
+    else:
+        board = ChessBoard(**boardOptions)
+        board.initializeBoard()
+    for ply in range(0,len(game.moves)):
+        san = game.moves[ply]
+        moveString = findBoardMove(board, san)
+        if(moveString is None or not board.pushMove(moveString)):
+            game.setError("Illegal move " + san + " at ply " + str(ply + 1))
+            break
+        if(not onPly is None):
+            onPly(board, ply + 1, san)
+    return board
+
+
+def streamPGNReplays(source, onPly = None, **boardOptions):
+    '''
+    Generator of (game, board) pairs for every game of a PGN file. Games with an
+    error are yielded too: board is None when the text or the FEN tag could not
+    be read and the position where the replay stopped otherwise.
+    '''
+    for game in readPGNGames(source):
+        if(not game.error is None):
+            yield game, None
+            continue
+        board = replayPGNGame(game, onPly, **boardOptions)
+        yield game, board
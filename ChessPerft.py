@@ -0,0 +1,122 @@
+'''
+Perft: the number of move sequences of a given length from a position, compared
+with the published counts of standard test positions. It checks the move lists
+computed by ChessPiece.computePieceMoves and the vision behind them, and measures
+their speed for each board backend (see the ChessBoard options).
+
+Every node plays the moves of the lists of the side to move, the last level is
+only counted.
+'''
+import sys
+import time
+from ChessGame import ChessBoard, ChessMove, PieceType, PieceColor
+
+#FEN and known node counts for depths 1, 2, ... of the usual perft positions
+PERFT_POSITIONS = {
+    "start": ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", [20, 400, 8902, 197281, 4865609]),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862, 4085603]),
+    "position3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    "position4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467, 422333]),
+    "position5": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487]),
+    "position6": ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079, 89890, 3894594])
+}
+
+
+def getLegalMoves(board):
+    '''
+    Moves of the side to move as (UCI string, move, pieces it moves) tuples, castling
+    once (it is in the lists of the king and of the rook)
+    '''
+    pieceColor = PieceColor(board.moveNumber % 2)
+    board.ensureSideMoves(pieceColor)
+    legalMoves = []
+    for piece in list(board.pieces):
+        if(piece.pieceColor != pieceColor):
+            continue
+        for move in piece.pieceMoves:
+            if(move.reducedString == "O-O" or move.reducedString == "O-O-O"):
+                if(piece.pieceType != PieceType.KING):
+                    continue
+                rookFile = "h" if move.reducedString == "O-O" else "a"
+                kingFile = "g" if move.reducedString == "O-O" else "c"
+                uciMove = piece.file + piece.rank + kingFile + piece.rank
+                legalMoves.append((uciMove, move, [piece, board.getPieceAtPosition(rookFile, piece.rank)]))
+            else:
+                file, rank = move.getPieceFinalPosition()
+                uciMove = piece.file + piece.rank + file + rank + move.promotion.lower()
+                legalMoves.append((uciMove, move, [piece]))
+    return legalMoves
+
+
+def perft(board, depth):
+    '''
+    Number of move sequences of depth moves from the position of the board
+    '''
+    legalMoves = getLegalMoves(board)
+    if(depth <= 1):
+        return len(legalMoves) if depth == 1 else 1
+
+    nodes = 0
+    for uciMove, move, movingPieces in legalMoves:
+        board.playMove(ChessMove(move.moveString, move.annotated), movingPieces, True)
+        nodes = nodes + perft(board, depth - 1)
+        board.popMove()
+    return nodes
+
+
+def divide(board, depth):
+    '''
+    perft of each move of the side to move, by UCI string, to find where a count
+    goes wrong
+    '''
+    counts = {}
+    for uciMove, move, movingPieces in getLegalMoves(board):
+        board.playMove(ChessMove(move.moveString, move.annotated), movingPieces, True)
+        counts[uciMove] = perft(board, depth - 1)
+        board.popMove()
+    return counts
+
+
+def runPerft(positions = None, maxDepth = 3, showDivide = False, **boardOptions):
+    '''
+    Runs perft up to maxDepth (or the deepest known count) on the named positions
+    of PERFT_POSITIONS (all by default), on boards built with boardOptions, and
+    prints the node counts, whether they match the known ones and the nodes per
+    second. Returns a list of result dicts.
+    '''
+    if(positions is None):
+        positions = list(PERFT_POSITIONS)
+
+    results = []
+    for name in positions:
+        fen, knownCounts = PERFT_POSITIONS[name]
+        for depth in range(1, min(maxDepth, len(knownCounts)) + 1):
+            board = ChessBoard.fromFEN(fen, **boardOptions)
+            startTime = time.perf_counter()
+            if(showDivide):
+                counts = divide(board, depth)
+                nodes = sum(counts.values())
+            else:
+                nodes = perft(board, depth)
+            elapsed = time.perf_counter() - startTime
+
+            result = {"position": name, "depth": depth, "nodes": nodes, "expected": knownCounts[depth - 1], "passed": nodes == knownCounts[depth - 1],
+                      "seconds": elapsed, "nodesPerSecond": nodes/max(elapsed, 1e-9)}
+            results.append(result)
+            print("%-10s depth %d: %9d nodes, expected %9d %-4s %10.0f nodes/s" % (name, depth, nodes, result["expected"], "OK" if result["passed"] else "FAIL", result["nodesPerSecond"]), flush = True)
+            if(showDivide):
+                for uciMove in sorted(counts):
+                    print("    " + uciMove + ": " + str(counts[uciMove]))
+    return results
+
+
+if __name__ == "__main__":
+    #python ChessPerft.py [maxDepth] [visionBackend] [moveUpdateMode]
+    maxDepth = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    boardOptions = {}
+    if(len(sys.argv) > 2):
+        boardOptions["visionBackend"] = sys.argv[2]
+    if(len(sys.argv) > 3):
+        boardOptions["moveUpdateMode"] = sys.argv[3]
+    results = runPerft(maxDepth = maxDepth, **boardOptions)
+    sys.exit(0 if all(result["passed"] for result in results) else 1)
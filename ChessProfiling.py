@@ -0,0 +1,169 @@
+'''
+Opt-in call counts and timings of the costly ChessBoard methods. A profiler
+replaces the methods of one board by timed wrappers, set on the board itself, so
+boards without a profiler (and the class) run the original methods untouched.
+Times are inclusive: a makeMove also counts the time of the calls it makes.
+
+Work is reported per ply and per game. A ply record holds the move itself and
+whatever is done on the position it leaves (graphs, metrics) until the next move,
+ply 0 being the setup and the work on the starting position.
+'''
+import json
+import time
+
+#Methods behind most of the replay time: move lists (computePieceMoves, updateSideMoves),
+#their legality filter (getLegalityMasks, isMoveLegal), check and mate tests
+#(isKingAttacked, hasLegalReply, isEnemyKingCheckmatedAfterMove) and vision
+#(getPieceBoardVision, getVisionBitboard)
+PROFILED_METHODS = ["getPieceBoardVision", "getVisionBitboard", "isEnemyKingCheckmatedAfterMove", "computePieceMoves", "makeMove", "pushMove",
+                    "isMoveLegal", "getLegalityMasks", "hasLegalReply", "updateSideMoves", "isKingAttacked"]
+#Methods that play a ply, a ply record ends with the outermost of them
+PLY_METHODS = ["makeMove", "makeMoveUCI", "pushMove", "pushMoveUCI"]
+#Methods taking moves back and playing them again, which are not new plies: their
+#work goes to the current position
+REPLAY_METHODS = ["getSANMoves"]
+
+
+class BoardProfiler:
+
+    def __init__(self, board, methods = PROFILED_METHODS):
+        self.board = board
+        self.methods = list(methods)
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.calls = {name: 0 for name in self.methods}
+        self.seconds = {name: 0.0 for name in self.methods}
+        self.gameCalls = {name: 0 for name in self.methods}
+        self.gameSeconds = {name: 0.0 for name in self.methods}
+        self.plies = []
+        #Ply methods running, only the outermost one ends a ply
+        self.plyDepth = 0
+
+    def enable(self):
+        if(self.enabled):
+            return
+        self.installWrappers()
+        self.enabled = True
+
+    def installWrappers(self):
+        '''
+        Sets the wrappers on the board, also used by a board being unpickled (the
+        wrappers are local functions, they are left out of its pickled state)
+        '''
+        for name in self.methods:
+            setattr(self.board, name, self.getTimedMethod(name, getattr(self.board, name)))
+        for name in PLY_METHODS:
+            setattr(self.board, name, self.getPlyMethod(getattr(self.board, name)))
+        for name in REPLAY_METHODS:
+            setattr(self.board, name, self.getReplayMethod(getattr(self.board, name)))
+
+    def getWrappedMethods(self):
+        return set(self.methods + PLY_METHODS + REPLAY_METHODS)
+
+    def disable(self):
+        if(not self.enabled):
+            return
+        #Removing the wrappers from the board brings back the class methods
+        for name in self.getWrappedMethods():
+            self.board.__dict__.pop(name, None)
+        self.enabled = False
+
+    def getTimedMethod(self, name, method):
+        calls = self.calls
+        seconds = self.seconds
+
+        def timedMethod(*args, **kwargs):
+            startTime = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                seconds[name] = seconds[name] + time.perf_counter() - startTime
+                calls[name] = calls[name] + 1
+        return timedMethod
+
+    def getPlyMethod(self, method):
+        board = self.board
+
+        def plyMethod(*args, **kwargs):
+            nMoves = len(board.executedMoves)
+            if(self.plyDepth == 0):
+                self.closePosition()
+            self.plyDepth = self.plyDepth + 1
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.plyDepth = self.plyDepth - 1
+                if(self.plyDepth == 0 and len(board.executedMoves) > nMoves):
+                    self.endPly(board.executedMoves[-1].moveString)
+        return plyMethod
+
+    def getReplayMethod(self, method):
+
+        def replayMethod(*args, **kwargs):
+            #Seen as running inside a ply method, the moves played again neither
+            #close the position nor end a ply
+            self.plyDepth = self.plyDepth + 1
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.plyDepth = self.plyDepth - 1
+        return replayMethod
+
+    def closePosition(self):
+        #Work done since the last move belongs to its ply
+        if(len(self.plies) == 0):
+            self.plies.append({"ply": 0, "move": None, "calls": {name: 0 for name in self.methods}, "seconds": {name: 0.0 for name in self.methods}})
+        record = self.plies[-1]
+        for name in self.methods:
+            record["calls"][name] = record["calls"][name] + self.calls[name]
+            record["seconds"][name] = record["seconds"][name] + self.seconds[name]
+        self.collectGameTotals()
+
+    def endPly(self, moveString):
+        self.plies.append({"ply": len(self.plies), "move": moveString, "calls": dict(self.calls), "seconds": dict(self.seconds)})
+        self.collectGameTotals()
+
+    def collectGameTotals(self):
+        for name in self.methods:
+            self.gameCalls[name] = self.gameCalls[name] + self.calls[name]
+            self.gameSeconds[name] = self.gameSeconds[name] + self.seconds[name]
+            self.calls[name] = 0
+            self.seconds[name] = 0.0
+
+    def getReport(self):
+        '''
+        Dict with the ply records, the game totals and the board options
+        '''
+        self.closePosition()
+        gameCalls = dict(self.gameCalls)
+        gameSeconds = dict(self.gameSeconds)
+        return {"visionBackend": self.board.visionBackend, "moveUpdateMode": self.board.moveUpdateMode, "nPlies": len(self.plies) - 1,
+                "plies": [dict(record, calls = dict(record["calls"]), seconds = dict(record["seconds"])) for record in self.plies], "game": {"calls": gameCalls, "seconds": gameSeconds}}
+
+    def toJSON(self, path = None):
+        '''
+        The report as a JSON string, also written to path if given
+        '''
+        text = json.dumps(self.getReport(), indent = 1)
+        if(not path is None):
+            with open(path, "w") as reportFile:
+                reportFile.write(text)
+        return text
+
+
+def combineReports(reports):
+    '''
+    Totals of the game parts of several reports (a corpus replayed on boards with
+    the same options), with the number of games and plies
+    '''
+    calls = {}
+    seconds = {}
+    nPlies = 0
+    for report in reports:
+        nPlies = nPlies + report["nPlies"]
+        for name in report["game"]["calls"]:
+            calls[name] = calls.get(name, 0) + report["game"]["calls"][name]
+            seconds[name] = seconds.get(name, 0.0) + report["game"]["seconds"][name]
+    return {"nGames": len(reports), "nPlies": nPlies, "calls": calls, "seconds": seconds}
@@ -0,0 +1,254 @@
+'''
+Batch rendering of games to GIF, MP4 or PNG sequences, without notebooks. Every
+frame shows the board after a ply next to its vision graph. Frames are drawn on
+Agg canvases (no window, nothing shown) by a pool of worker processes, which get
+the piece sprites already resized from the main process instead of reading the
+image files themselves.
+
+The format comes from the output path: ".gif", ".mp4" (needs ffmpeg) or, for
+anything else, a folder where every frame is written as ply_0000.png, ...
+'''
+import os
+import shutil
+import subprocess
+import numpy as np
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import ChessGame
+from ChessGame import ChessBoard, BoardFigure, PieceType, PieceColor, getPieceSprite
+from ChessGraph import ChessGraph
+from ChessPGN import readPGNGames
+
+
+def getSprites(spriteSize = 64, imageFolder = "PieceImages"):
+    '''
+    The sprite cache of ChessGame filled with the 12 pieces, to hand to the workers
+    '''
+    for pieceType in PieceType:
+        for pieceColor in PieceColor:
+            getPieceSprite(pieceType, pieceColor, spriteSize, spriteSize, imageFolder)
+    return dict(ChessGame.PIECE_SPRITES)
+
+
+def initializeWorker(sprites):
+    ChessGame.PIECE_SPRITES.update(sprites)
+
+
+class GameFrameRenderer:
+    '''
+    Agg figure with the board on the left and the vision graph of the position on
+    the right, kept for all the frames of a worker. graphColor is the side whose
+    graph is drawn (None for both sides).
+    '''
+
+    def __init__(self, graphColor = None, dpi = 100, spriteSize = 64):
+        self.graphColor = graphColor
+        self.fig = Figure(figsize = (8,4), dpi = dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        boardAx, self.graphAx = self.fig.subplots(1, 2)
+        self.boardFigure = None
+        self.boardAx = boardAx
+        self.spriteSize = spriteSize
+
+    def renderFrame(self, board, title):
+        '''
+        RGB array (height x width x 3) of the figure for the position of board
+        '''
+        if(self.boardFigure is None):
+            self.boardFigure = BoardFigure(board.whiteColor, board.blackColor, ax = self.boardAx, spriteSize = self.spriteSize)
+        self.boardFigure.update(board)
+        self.boardAx.set_title(title)
+
+        self.graphAx.clear()
+        graph = ChessGraph(board, not self.graphColor is None, self.graphColor)
+        graph.drawGraph(self.graphAx)
+        self.graphAx.set_xlim([-0.5,7.5])
+        self.graphAx.set_ylim([-0.5,7.5])
+        self.graphAx.set_aspect("equal")
+        self.graphAx.set_xticks(np.arange(0,8,1))
+        self.graphAx.set_xticklabels(ChessGame.FILE_NAMES)
+        self.graphAx.set_yticks(np.arange(0,8,1))
+        self.graphAx.set_yticklabels(ChessGame.RANK_NAMES)
+
+        self.canvas.draw()
+        return np.array(self.canvas.buffer_rgba())[:, :, :3]
+
+
+def getPlyTitle(board):
+    '''
+    Number and SAN of the last move of board ("12. Nf3", "12... Nc6"), counted from
+    the move number of the starting position (a FEN one included)
+    '''
+    if(len(board.executedMoves) == 0):
+        return "Initial position"
+    moveNumber = board.moveNumber - 1
+    return str(moveNumber//2 + 1) + ("." if moveNumber % 2 == 0 else "...") + " " + board.executedMoves[-1].moveString
+
+
+def getStartBoard(fen, boardOptions):
+    if(fen is None):
+        board = ChessBoard(**boardOptions)
+        board.initializeBoard()
+        return board
+    return ChessBoard.fromFEN(fen, **boardOptions)
+
+
+def renderPlyRange(task):
+    '''
+    Worker side: frames of the plies firstPly to lastPly (included) of a game. task
+    is (gameMoves, fen, firstPly, lastPly, renderOptions, boardOptions). Returns -1
+    if the FEN or a move is refused, so a game is never rendered cut short.
+    '''
+    gameMoves, fen, firstPly, lastPly, renderOptions, boardOptions = task
+    board = getStartBoard(fen, boardOptions)
+    if(board is None):
+        print("Invalid FEN " + fen)
+        return -1
+    for i in range(0,firstPly):
+        if(not board.pushMove(gameMoves[i])):
+            print("Invalid move " + gameMoves[i] + " at ply " + str(i + 1))
+            return -1
+
+    renderer = GameFrameRenderer(**renderOptions)
+    frames = []
+    for ply in range(firstPly, lastPly + 1):
+        if(ply > firstPly and not board.pushMove(gameMoves[ply - 1])):
+            print("Invalid move " + gameMoves[ply - 1] + " at ply " + str(ply))
+            return -1
+        frames.append(renderer.renderFrame(board, getPlyTitle(board)))
+    return frames
+
+
+def writeFrames(frames, outputPath, fps = 2):
+    '''
+    Writes RGB frames to outputPath (see the module), returns the number of frames
+    written or -1 if the format can not be written
+    '''
+    if(len(frames) == 0):
+        print("No frames to write")
+        return -1
+
+    if(outputPath.lower().endswith(".gif")):
+        images = [Image.fromarray(frame) for frame in frames]
+        images[0].save(outputPath, save_all = True, append_images = images[1:], duration = int(1000/fps), loop = 0)
+    elif(outputPath.lower().endswith(".mp4")):
+        ffmpegPath = matplotlib.rcParams["animation.ffmpeg_path"]
+        if(shutil.which(ffmpegPath) is None):
+            print("ffmpeg was not found, it is needed to write " + outputPath)
+            return -1
+        #yuv420p needs an even width and height
+        height = frames[0].shape[0] - frames[0].shape[0] % 2
+        width = frames[0].shape[1] - frames[0].shape[1] % 2
+        command = [ffmpegPath, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", str(width) + "x" + str(height),
+                   "-r", str(fps), "-i", "-", "-vcodec", "libx264", "-pix_fmt", "yuv420p", outputPath]
+        process = subprocess.Popen(command, stdin = subprocess.PIPE)
+        for frame in frames:
+            process.stdin.write(np.ascontiguousarray(frame[:height, :width]).tobytes())
+        process.stdin.close()
+        if(process.wait() != 0):
+            print("ffmpeg could not write " + outputPath)
+            return -1
+    else:
+        os.makedirs(outputPath, exist_ok = True)
+        for ply in range(0,len(frames)):
+            Image.fromarray(frames[ply]).save(os.path.join(outputPath, "ply_%04d.png" % ply))
+    return len(frames)
+
+
+def renderGame(gameMoves, outputPath, fen = None, fps = 2, nWorkers = 1, graphColor = None, dpi = 100, **boardOptions):
+    '''
+    Renders every ply of a game (move strings as given to makeMove, from the FEN
+    position if given) to outputPath. The plies are split in nWorkers consecutive
+    ranges, each replayed and drawn by a worker process. boardOptions go to the
+    ChessBoard constructor. Returns the number of frames written, -1 on error.
+    '''
+    renderOptions = {"graphColor": graphColor, "dpi": dpi}
+    nPlies = len(gameMoves)
+    if(nWorkers <= 1):
+        frames = renderPlyRange((gameMoves, fen, 0, nPlies, renderOptions, boardOptions))
+        if(frames == -1):
+            return -1
+        return writeFrames(frames, outputPath, fps)
+
+    bounds = np.linspace(0, nPlies + 1, nWorkers + 1).astype(int)
+    tasks = [(gameMoves, fen, bounds[i], bounds[i + 1] - 1, renderOptions, boardOptions) for i in range(0,nWorkers) if bounds[i + 1] > bounds[i]]
+    with ProcessPoolExecutor(max_workers = nWorkers, initializer = initializeWorker, initargs = (getSprites(),)) as pool:
+        frames = []
+        for rangeFrames in pool.map(renderPlyRange, tasks):
+            #A range with an invalid move fails the game
+            if(rangeFrames == -1):
+                return -1
+            frames.extend(rangeFrames)
+    return writeFrames(frames, outputPath, fps)
+
+
+def renderGameTask(task):
+    '''
+    Worker side of renderGames: renders and writes one game. task is (name,
+    gameMoves, fen, outputPath, fps, renderOptions, boardOptions). Returns (name,
+    number of frames written), -1 frames if the game failed.
+    '''
+    name, gameMoves, fen, outputPath, fps, renderOptions, boardOptions = task
+    #A failed game is reported and the batch goes on with the next one
+    try:
+        frames = renderPlyRange((gameMoves, fen, 0, len(gameMoves), renderOptions, boardOptions))
+        if(frames == -1):
+            return name, -1
+        return name, writeFrames(frames, outputPath, fps)
+    except Exception as error:
+        print("Game " + str(name) + " failed: " + repr(error), flush = True)
+        return name, -1
+
+
+def renderGames(games, outputFolder, outputFormat = "gif", fps = 2, nWorkers = None, graphColor = None, dpi = 100, showProgress = True, **boardOptions):
+    '''
+    Renders many games, one per worker task, into outputFolder. games is an iterable
+    of (name, gameMoves) or (name, gameMoves, fen) tuples, each written as name.gif,
+    name.mp4 or a name folder of PNG frames for outputFormat "gif", "mp4" or "png".
+    Games are read from the iterable as the workers need them. Returns a dict with
+    the number of frames written by game name (-1 for games that failed).
+    '''
+    os.makedirs(outputFolder, exist_ok = True)
+    if(nWorkers is None):
+        nWorkers = os.cpu_count()
+    renderOptions = {"graphColor": graphColor, "dpi": dpi}
+    extension = "" if outputFormat == "png" else "." + outputFormat
+    maxPending = 2*nWorkers
+
+    results = {}
+    with ProcessPoolExecutor(max_workers = nWorkers, initializer = initializeWorker, initargs = (getSprites(),)) as pool:
+        pending = set()
+
+        def collect(doneFutures):
+            for future in doneFutures:
+                name, nFrames = future.result()
+                results[name] = nFrames
+                if(showProgress):
+                    print("Games %d, last %s (%d frames)" % (len(results), name, nFrames), flush = True)
+
+        for game in games:
+            name, gameMoves = game[0], game[1]
+            fen = game[2] if len(game) > 2 else None
+            outputPath = os.path.join(outputFolder, str(name) + extension)
+            pending.add(pool.submit(renderGameTask, (name, gameMoves, fen, outputPath, fps, renderOptions, boardOptions)))
+            if(len(pending) >= maxPending):
+                doneFutures, pending = wait(pending, return_when = FIRST_COMPLETED)
+                collect(doneFutures)
+
+        doneFutures, pending = wait(pending)
+        collect(doneFutures)
+
+    return results
+
+
+def iteratePGNGames(pgnSource):
+    '''
+    (name, moves, fen) of the readable games of a PGN file for renderGames, named
+    by their position in the file
+    '''
+    for gameId, game in enumerate(readPGNGames(pgnSource)):
+        if(game.error is None):
+            yield "game_%06d" % gameId, game.moves, game.tags.get("FEN")